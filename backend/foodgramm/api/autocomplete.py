@@ -0,0 +1,64 @@
+import threading
+from bisect import bisect_left
+
+from django.conf import settings
+from recipe.models import Ingredient
+
+from .cache import INGREDIENTS_VERSION, get_version
+
+
+class IngredientIndex:
+    """Индекс названий ингредиентов в памяти процесса.
+    Названия хранятся отсортированными, поэтому совпадения по префиксу
+    находятся двоичным поиском. Индекс перестраивается, когда меняется
+    версия справочника ингредиентов; версия хранится в общем кэше,
+    поэтому загрузка ингредиентов командой или другим процессом
+    перестраивает индексы всех процессов.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._keys = []
+        self._items = []
+
+    def _build(self, version):
+        items = sorted(
+            Ingredient.objects.values('id', 'name', 'measurement_unit'),
+            key=lambda item: (item['name'].lower(), item['id'])
+        )
+        self._keys = [item['name'].lower() for item in items]
+        self._items = items
+        self._version = version
+
+    def _ensure_fresh(self):
+        version = get_version(INGREDIENTS_VERSION)
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._build(version)
+
+    def search(self, query, limit=None):
+        """Ингредиенты, название которых начинается с query,
+        а за ними ингредиенты, содержащие query в середине названия;
+        не больше limit (по умолчанию INGREDIENT_SEARCH_LIMIT).
+        """
+        if limit is None:
+            limit = settings.INGREDIENT_SEARCH_LIMIT
+        self._ensure_fresh()
+        keys, items = self._keys, self._items
+        query = query.lower()
+        start = bisect_left(keys, query)
+        end = bisect_left(keys, query + '\uffff', lo=start)
+        result = items[start:min(end, start + limit)]
+        if len(result) >= limit:
+            return result
+        for position, key in enumerate(keys):
+            if start <= position < end or query not in key:
+                continue
+            result.append(items[position])
+            if len(result) >= limit:
+                break
+        return result
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,78 @@
+import hashlib
+import re
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.db import transaction
+
+INGREDIENTS_VERSION = 'ingredients'
+RECIPES_VERSION = 'recipes'
+SCORES_VERSION = 'scores'
+SEARCH_VERSION = 'search'
+TAGS_VERSION = 'tags'
+# Ограничения memcached на ключ: не длиннее 250 байт, без пробелов
+# и управляющих символов.
+MAX_KEY_LENGTH = 250
+KEY_CHARACTERS = re.compile(r'[!-~]+')
+
+
+def make_key(key, key_prefix, version):
+    """Ключ кэша (KEY_FUNCTION): ключи, недопустимые для memcached,
+    например с адресом запроса на кириллице, заменяются хэшем.
+    """
+    full_key = f'{key_prefix}:{version}:{key}'
+    if (len(full_key) <= MAX_KEY_LENGTH
+            and KEY_CHARACTERS.fullmatch(full_key)):
+        return full_key
+    digest = hashlib.sha1(key.encode()).hexdigest()
+    return f'{key_prefix}:{version}:sha1:{digest}'
+
+
+def _version_key(name):
+    return f'version:{name}'
+
+
+def _new_version():
+    return uuid4().hex
+
+
+def get_version(name):
+    """Текущая версия набора данных.
+    Версия хранится в общем кэше, поэтому её смена видна всем процессам.
+    """
+    return cache.get_or_set(_version_key(name), _new_version, timeout=None)
+
+
+def get_versions(names):
+    """Текущие версии нескольких наборов данных одним обращением к кэшу.
+    """
+    keys = {_version_key(name): name for name in names}
+    versions = cache.get_many(keys)
+    for key in keys.keys() - versions.keys():
+        cache.add(key, _new_version(), timeout=None)
+        versions[key] = cache.get(key)
+    return {keys[key]: version for key, version in versions.items()}
+
+
+def bump_version(name):
+    """Отметка, что набор данных изменился.
+    """
+    bump_versions((name,))
+
+
+def bump_versions(names):
+    """Смена версий после фиксации транзакции: иначе параллельный
+    запрос успел бы закэшировать старые данные под новой версией.
+    """
+    versions = {_version_key(name): _new_version() for name in names}
+    transaction.on_commit(
+        lambda: cache.set_many(versions, timeout=None)
+    )
+
+
+def recipe_version_name(recipe_id):
+    return f'recipe:{recipe_id}'
+
+
+def user_version_name(user_id):
+    return f'user:{user_id}'
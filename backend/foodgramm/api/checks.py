@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.checks import Error, register
+
+PER_PROCESS_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+)
+
+
+@register()
+def shared_cache_check(app_configs, **kwargs):
+    """Версии наборов данных меняются в одном процессе (запрос, команда
+    управления), а читаются во всех, поэтому кэш должен быть общим.
+    """
+    backend = settings.CACHES['default']['BACKEND']
+    if backend not in PER_PROCESS_BACKENDS:
+        return []
+    return [Error(
+        f'Кэш {backend} не виден другим процессам.',
+        hint=(
+            'Укажите в CACHE_BACKEND общий кэш, например '
+            'django.core.cache.backends.memcached.MemcachedCache '
+            'или django.core.cache.backends.db.DatabaseCache '
+            '(таблицу создаёт команда createcachetable).'
+        ),
+        id='api.E001',
+    )]
@@ -1,11 +1,62 @@
 import django_filters as filters
-from recipe.models import Recipe
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import (Case, Exists, F, IntegerField, OuterRef, Value,
+                              When)
+from recipe.models import FavoriteList, Ingredient, Recipe, ShoppingList, Tag
 from users.models import User
 
+from .cache import TAGS_VERSION, get_version
+from .search import search_recipes
+
+
+class IngredientFilter(filters.FilterSet):
+    """Поиск ингредиента по названию.
+    Совпадения по началу названия идут раньше совпадений в середине.
+    """
+    name = filters.CharFilter(method='get_name')
+
+    class Meta:
+        model = Ingredient
+        fields = ['name']
+
+    def get_name(self, queryset, name, value):
+        return queryset.filter(name__icontains=value).annotate(
+            rank=Case(
+                When(name__istartswith=value, then=Value(0)),
+                default=Value(1),
+                output_field=IntegerField(),
+            )
+        ).order_by('rank', 'name')
+
+
+def tag_choices():
+    """Варианты фильтра по тэгам из кэша справочника тэгов.
+    """
+    key = f'tag_choices:{get_version(TAGS_VERSION)}'
+    choices = cache.get(key)
+    if choices is None:
+        choices = [(slug, slug) for slug in Tag.objects.values_list(
+            'slug', flat=True
+        )]
+        cache.set(key, choices, settings.REFERENCE_CACHE_TIMEOUT)
+    return choices
+
+
+ORDERING_CHOICES = (
+    ('popular', 'popular'),
+    ('trending', 'trending'),
+)
+
 
 class RecipeFilter(filters.FilterSet):
-    tags = filters.AllValuesMultipleFilter(
-        field_name='tags__slug'
+    """Фильтрация ленты рецептов.
+    Все условия строятся подзапросами EXISTS, поэтому рецепт
+    с несколькими подходящими тэгами не дублируется в выдаче.
+    """
+    tags = filters.MultipleChoiceFilter(
+        choices=tag_choices,
+        method='get_tags'
     )
     author = filters.ModelChoiceFilter(
         queryset=User.objects.all()
@@ -16,17 +67,66 @@ class RecipeFilter(filters.FilterSet):
     is_in_shopping_cart = filters.NumberFilter(
         method='get_is_in_shopping_cart'
     )
+    search = filters.CharFilter(
+        method='get_search'
+    )
+    ordering = filters.ChoiceFilter(
+        choices=ORDERING_CHOICES,
+        method='get_ordering'
+    )
 
     class Meta:
         model = Recipe
-        fields = ['tags', 'author', 'is_favorited', 'is_in_shopping_cart']
+        fields = ['tags', 'author', 'is_favorited', 'is_in_shopping_cart',
+                  'search', 'ordering']
+
+    def filter_exists(self, queryset, name, subquery):
+        return queryset.annotate(**{name: Exists(subquery)}).filter(
+            **{name: True}
+        )
+
+    def get_tags(self, queryset, name, value):
+        return self.filter_exists(
+            queryset, 'has_tags', Recipe.tags.through.objects.filter(
+                recipe_id=OuterRef('pk'), tag__slug__in=value
+            )
+        )
 
     def get_is_favorited(self, queryset, name, value):
-        if value:
-            return queryset.filter(favorite_recipe__user=self.request.user)
-        return queryset
+        if not value:
+            return queryset
+        if self.request.user.is_anonymous:
+            return queryset.none()
+        return self.filter_exists(
+            queryset, 'in_favorites', FavoriteList.objects.filter(
+                user=self.request.user, recipe_id=OuterRef('pk')
+            )
+        )
 
     def get_is_in_shopping_cart(self, queryset, name, value):
-        if value:
-            return queryset.filter(recipe_in_shoplist__user=self.request.user)
-        return queryset
+        if not value:
+            return queryset
+        if self.request.user.is_anonymous:
+            return queryset.none()
+        return self.filter_exists(
+            queryset, 'in_cart', ShoppingList.objects.filter(
+                user=self.request.user, recipe_id=OuterRef('pk')
+            )
+        )
+
+    def get_search(self, queryset, name, value):
+        """Полнотекстовый поиск по названию, описанию и ингредиентам.
+        Выдача упорядочена по рангу; keyset-пагинация (параметр cursor)
+        сохраняет порядок по дате публикации.
+        """
+        return search_recipes(queryset, value)
+
+    def get_ordering(self, queryset, name, value):
+        """Сортировка по материализованной оценке из RecipeScore:
+        рецепты читаются по индексу (-оценка, -рецепт) без агрегатов
+        по избранному и спискам покупок. Keyset-пагинация
+        (параметр cursor) сохраняет порядок по дате публикации.
+        """
+        return queryset.filter(score__isnull=False).order_by(
+            F(f'score__{value}').desc(), F('score__recipe_id').desc()
+        )
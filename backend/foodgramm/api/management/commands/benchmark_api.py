@@ -0,0 +1,329 @@
+import base64
+import io
+import json
+import os
+import statistics
+import time
+import tracemalloc
+from datetime import datetime
+from urllib.parse import quote
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.db import BaseDatabaseCache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from PIL import Image
+from recipe.models import Ingredient, IngredientAmount, Recipe, Tag
+from recipe.timeline import build_timeline
+from rest_framework.test import APIClient
+from users.models import Follow, User
+
+PIXEL = base64.b64encode(bytes.fromhex(
+    '89504e470d0a1a0a0000000d4948445200000001000000010802000000'
+    '907753de0000000c49444154789c63f8ffff3f0005fe02fe0def46b800'
+    '00000049454e44ae426082'
+)).decode()
+PERCENTILES = (50, 95, 99)
+# Обе стратегии ленты подписок замеряются для одного пользователя;
+# лента для чтения из TimelineEntry строится в откатываемой транзакции.
+FEED_STRATEGIES = {
+    'following_feed_timeline': {'FEED_TIMELINE_MIN_FOLLOWS': 0},
+    'following_feed_merged': {
+        'FEED_TIMELINE_MIN_FOLLOWS': float('inf'),
+    },
+}
+
+
+def percentile(timings, rank):
+    """Перцентиль по отсортированному списку методом ближайшего ранга.
+    """
+    index = max(0, -(-len(timings) * rank // 100) - 1)
+    return timings[min(index, len(timings) - 1)]
+
+
+class Command(BaseCommand):
+    help = 'measuring latency and queries of the main API endpoints'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', default=20, type=int)
+        parser.add_argument('--warmup', default=2, type=int)
+        parser.add_argument('--cold-repeat', default=5, type=int,
+                            help='повторы с очисткой всего кэша перед '
+                                 'каждым запросом; 0 — не замерять')
+        parser.add_argument('--user', type=str,
+                            help='email пользователя для запросов')
+        parser.add_argument('--only', nargs='+', metavar='SCENARIO',
+                            help='запустить только указанные сценарии')
+        parser.add_argument('--output', type=str,
+                            help='файл для сохранения результатов в JSON')
+        parser.add_argument('--compare', type=str,
+                            help='JSON с результатами предыдущего запуска')
+        parser.add_argument('--label', type=str, default='',
+                            help='метка запуска, например хэш коммита')
+        parser.add_argument('--memory', action='store_true',
+                            help='замерять пиковую память на запрос')
+        parser.add_argument('--upload-size', default=5, type=float,
+                            help='размер изображения в recipe_create_large')
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['user'])
+        clients = {False: APIClient(SERVER_NAME='localhost')}
+        if user is not None:
+            clients[True] = APIClient(SERVER_NAME='localhost')
+            clients[True].force_authenticate(user)
+        scenarios = [
+            scenario for scenario in self.scenarios(user)
+            if scenario[3] in clients
+            and (not options['only'] or scenario[0] in options['only'])
+        ]
+        if not scenarios:
+            raise CommandError('Нет сценариев для запуска')
+        if isinstance(caches['default'], BaseDatabaseCache):
+            self.stderr.write(
+                'Кэш хранится в базе и откатывается вместе с транзакцией '
+                'каждого повтора: тёплые замеры не отличаются от холодных.'
+            )
+        self.memory = options['memory']
+        self.upload_size = options['upload_size']
+        results = {}
+        for name, method, url, authenticated in scenarios:
+            for state, summary in self.run_scenario(
+                name, clients[authenticated], method, url, user, options
+            ).items():
+                results[f'{name}:{state}'] = summary
+                self.report(f'{name}:{state}', summary)
+        if options['compare']:
+            self.compare(results, options['compare'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump({
+                    'label': options['label'],
+                    'created': datetime.now().isoformat(timespec='seconds'),
+                    'database': connection.vendor,
+                    'repeat': options['repeat'],
+                    'cold_repeat': options['cold_repeat'],
+                    'upload_size': options['upload_size'],
+                    'results': results,
+                }, file, ensure_ascii=False, indent=2)
+
+    def run_scenario(self, name, client, method, url, user, options):
+        """Замеры сценария с холодным (очищаемым перед каждым повтором)
+        и тёплым кэшем.
+        """
+        payload = self.recipe_payload(name) if method != 'get' else None
+        summaries = {}
+        with transaction.atomic(), override_settings(
+            **FEED_STRATEGIES.get(name, {})
+        ):
+            if name == 'following_feed_timeline':
+                build_timeline(user.id)
+            if options['cold_repeat']:
+                summaries['cold'] = self.summarize(*self.measure(
+                    client, method, url, payload,
+                    options['cold_repeat'], cold=True
+                ))
+            self.measure(client, method, url, payload, options['warmup'])
+            summaries['warm'] = self.summarize(*self.measure(
+                client, method, url, payload, options['repeat']
+            ))
+            transaction.set_rollback(True)
+        return summaries
+
+    def get_user(self, email):
+        if email:
+            user = User.objects.filter(email=email).first()
+            if user is None:
+                raise CommandError('Пользователь не найден')
+            return user
+        return User.objects.filter(
+            recipe_in_shoplist__isnull=False
+        ).first() or User.objects.first()
+
+    def scenarios(self, user):
+        tags = list(Tag.objects.values_list('slug', flat=True)[:2])
+        tag_query = '&'.join(f'tags={slug}' for slug in tags)
+        recipe_id = Recipe.objects.values_list('id', flat=True).first()
+        scenarios = [
+            ('feed', 'get', '/api/recipes/', False),
+            ('feed_tags', 'get', f'/api/recipes/?{tag_query}', False),
+            ('feed_cursor_tags', 'get',
+             f'/api/recipes/?cursor=&{tag_query}', False),
+            ('feed_popular', 'get', '/api/recipes/?ordering=popular', False),
+            ('feed_trending', 'get',
+             f'/api/recipes/?ordering=trending&{tag_query}', False),
+        ]
+        if recipe_id is not None:
+            scenarios += [
+                ('recipe_detail', 'get', f'/api/recipes/{recipe_id}/', False),
+                ('recipe_similar', 'get',
+                 f'/api/recipes/{recipe_id}/similar/', False),
+            ]
+        pantry = '&'.join(
+            f'ingredients={ingredient_id}'
+            for ingredient_id in IngredientAmount.objects.values_list(
+                'ingredient_id', flat=True
+            ).distinct()[:20]
+        )
+        scenarios.append(
+            ('pantry', 'get', f'/api/recipes/pantry/?{pantry}', False)
+        )
+        if user is None:
+            return scenarios
+        author = Follow.objects.filter(user=user).values_list(
+            'author_id', flat=True
+        ).first() or user.id
+        ingredient = IngredientAmount.objects.values_list(
+            'ingredient__name', flat=True
+        ).first() or 'рецепт'
+        return scenarios + [
+            ('feed_auth', 'get', '/api/recipes/', True),
+            ('feed_author', 'get', f'/api/recipes/?author={author}', True),
+            ('feed_favorited', 'get', '/api/recipes/?is_favorited=1', True),
+            ('feed_in_cart', 'get',
+             '/api/recipes/?is_in_shopping_cart=1', True),
+            ('search_ingredient', 'get',
+             f'/api/recipes/?search={quote(ingredient)}', True),
+            ('search_common', 'get',
+             f'/api/recipes/?search={quote("рецепт пирог")}', True),
+            ('subscriptions', 'get',
+             '/api/users/subscriptions/?recipes_limit=3', True),
+            ('following_feed', 'get', '/api/recipes/feed/', True),
+            ('following_feed_timeline', 'get', '/api/recipes/feed/', True),
+            ('following_feed_merged', 'get', '/api/recipes/feed/', True),
+            ('download_shopping_cart', 'get',
+             '/api/recipes/download_shopping_cart/', True),
+            ('shopping_cart_summary', 'get',
+             '/api/recipes/shopping_cart_summary/', True),
+            ('recipe_create', 'post', '/api/recipes/', True),
+            ('recipe_create_large', 'post', '/api/recipes/', True),
+        ]
+
+    def large_image(self):
+        """PNG из случайного шума: почти не сжимается, поэтому
+        размер файла близок к --upload-size.
+        """
+        side = int((self.upload_size * 2 ** 20 / 3) ** 0.5)
+        image = Image.frombytes(
+            'RGB', (side, side), os.urandom(side * side * 3)
+        )
+        content = io.BytesIO()
+        image.save(content, format='PNG', compress_level=0)
+        return base64.b64encode(content.getvalue()).decode()
+
+    def recipe_payload(self, name):
+        if name == 'recipe_create_large':
+            image = self.large_image()
+        else:
+            image = PIXEL
+        return {
+            'name': 'Рецепт для замера',
+            'text': 'Создаётся и откатывается в транзакции.',
+            'cooking_time': 10,
+            'image': f'data:image/png;base64,{image}',
+            'tags': list(Tag.objects.values_list('id', flat=True)[:2]),
+            'ingredients': [
+                {'id': ingredient_id, 'amount': 100}
+                for ingredient_id in Ingredient.objects.values_list(
+                    'id', flat=True
+                )[:5]
+            ],
+        }
+
+    def request(self, client, method, url, payload):
+        if method == 'get':
+            response = client.get(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            return response
+        return client.post(url, payload, format='json')
+
+    def discard(self, response):
+        """Удаление файла изображения созданного рецепта;
+        сама запись откатывается вместе с транзакцией.
+        """
+        if response.status_code == 201:
+            Recipe.objects.get(id=response.data['id']).image.delete(
+                save=False
+            )
+
+    def measure(self, client, method, url, payload, repeat, cold=False):
+        """Повторы запроса; каждый выполняется в откатываемой транзакции,
+        чтобы сценарии записи не меняли данные. С cold перед каждым
+        повтором очищается кэш (вместе с версиями данных, поэтому
+        индексы в памяти тоже перестраиваются); очистка в замер
+        не входит. С --memory пиковая память считается через
+        tracemalloc, что заметно замедляет запросы.
+        """
+        expected = 200 if method == 'get' else 201
+        timings = []
+        queries = 0
+        peak_memory = 0
+        elapsed = 0
+        for _ in range(repeat):
+            if cold:
+                cache.clear()
+            started = time.perf_counter()
+            with transaction.atomic():
+                if self.memory:
+                    tracemalloc.start()
+                with CaptureQueriesContext(connection) as captured:
+                    request_started = time.perf_counter()
+                    response = self.request(client, method, url, payload)
+                    timings.append(
+                        (time.perf_counter() - request_started) * 1000
+                    )
+                if self.memory:
+                    peak_memory = max(
+                        peak_memory, tracemalloc.get_traced_memory()[1]
+                    )
+                    tracemalloc.stop()
+                self.discard(response)
+                transaction.set_rollback(True)
+            elapsed += time.perf_counter() - started
+            if response.status_code != expected:
+                raise CommandError(f'{url}: статус {response.status_code}')
+            queries = max(queries, len(captured.captured_queries))
+        return timings, queries, elapsed, peak_memory
+
+    def summarize(self, timings, queries, elapsed, peak_memory):
+        if not timings:
+            raise CommandError('Количество повторов должно быть больше нуля')
+        timings.sort()
+        summary = {
+            f'p{rank}': round(percentile(timings, rank), 2)
+            for rank in PERCENTILES
+        }
+        summary['mean'] = round(statistics.mean(timings), 2)
+        summary['throughput'] = round(len(timings) / elapsed, 1)
+        summary['queries'] = queries
+        if self.memory:
+            summary['peak_kb'] = round(peak_memory / 1024)
+        return summary
+
+    def report(self, name, summary):
+        latency = ', '.join(
+            f'p{rank} {summary[f"p{rank}"]:.1f} ms' for rank in PERCENTILES
+        )
+        memory = (
+            f', пиковая память {summary["peak_kb"]} Кб'
+            if 'peak_kb' in summary else ''
+        )
+        self.stdout.write(
+            f'{name}: {latency}, {summary["throughput"]} запросов/с, '
+            f'запросов к БД {summary["queries"]}{memory}'
+        )
+
+    def compare(self, results, path):
+        with open(path, encoding='utf-8') as file:
+            previous = json.load(file)['results']
+        for name, summary in results.items():
+            if name not in previous:
+                continue
+            before = previous[name]
+            change = (summary['p95'] - before['p95']) / before['p95'] * 100
+            self.stdout.write(
+                f'{name}: p95 {before["p95"]:.1f} -> {summary["p95"]:.1f} ms '
+                f'({change:+.0f}%), запросов к БД '
+                f'{before["queries"]} -> {summary["queries"]}'
+            )
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+from recipe.similar import build_similar
+
+
+class Command(BaseCommand):
+    help = 'precomputing the table of similar recipes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipe', type=int, nargs='+',
+                            help='id рецептов для пересчёта')
+        parser.add_argument('--batch-size', type=int)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        processed = build_similar(options['recipe'], options['batch_size'])
+        self.stdout.write(
+            f'Обработано рецептов: {processed} '
+            f'за {time.perf_counter() - started:.1f} с'
+        )
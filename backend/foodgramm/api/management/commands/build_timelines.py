@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipe.models import TimelineEntry
+from recipe.timeline import (build_timeline, overflowing_timelines,
+                             trim_timeline)
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'backfilling or trimming precomputed following feed timelines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--trim', action='store_true',
+                            help='только обрезать ленты длиннее '
+                                 'FEED_TIMELINE_LENGTH записей; '
+                                 'запускается периодически')
+        parser.add_argument('--user', type=str,
+                            help='email пользователя')
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(
+            following_count__gte=settings.FEED_TIMELINE_MIN_FOLLOWS
+        )
+        if options['user']:
+            users = users.filter(email=options['user'])
+        else:
+            removed = TimelineEntry.objects.exclude(
+                user__in=users
+            ).delete()[0]
+            self.stdout.write(f'Удалено записей лишних лент: {removed}')
+        user_ids = users.values_list('id', flat=True)
+        if options['trim']:
+            user_ids = user_ids.filter(id__in=overflowing_timelines())
+        processed = 0
+        for user_id in user_ids.iterator():
+            with transaction.atomic():
+                if options['trim']:
+                    trim_timeline(user_id)
+                else:
+                    build_timeline(user_id)
+            processed += 1
+        self.stdout.write(f'Обработано лент: {processed}')
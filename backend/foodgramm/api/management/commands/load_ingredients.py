@@ -1,35 +1,100 @@
+import csv
 import json
 import os
+from itertools import islice
 
+from api.cache import INGREDIENTS_VERSION, bump_version
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
-from django.db.utils import IntegrityError
+from django.db import transaction
 from recipe.models import Ingredient
 
 DATA_ROOT = os.path.join(settings.BASE_DIR, 'data')
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def read_json(file):
+    """Потоковое чтение JSON-массива объектов без загрузки файла целиком.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    for chunk in iter(lambda: file.read(READ_CHUNK_SIZE), ''):
+        buffer += chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if not started and buffer.startswith('[', position):
+                started = True
+                position += 1
+                continue
+            if buffer.startswith(']', position):
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except ValueError:
+                break
+            yield item
+        buffer = buffer[position:]
+    if buffer.strip():
+        raise CommandError('Некорректный JSON в файле с ингредиентами')
+
+
+def read_csv(file):
+    header = file.readline()
+    delimiter = ';' if ';' in header else ','
+    fieldnames = next(csv.reader([header], delimiter=delimiter))
+    if 'name' not in fieldnames:
+        fieldnames = ['name', 'measurement_unit']
+        file.seek(0)
+    yield from csv.DictReader(file, fieldnames=fieldnames,
+                              delimiter=delimiter)
+
+
+READERS = {
+    '.json': read_json,
+    '.csv': read_csv,
+}
 
 
 class Command(BaseCommand):
-    help = 'loading ingredients from data in json'
+    help = 'loading ingredients from data in json or csv'
 
     def add_arguments(self, parser):
         parser.add_argument('filename', default='ingredients.json', nargs='?',
                             type=str)
+        parser.add_argument('--batch-size', default=1000, type=int)
 
     def handle(self, *args, **options):
+        path = os.path.join(DATA_ROOT, options['filename'])
+        reader = READERS.get(os.path.splitext(path)[1].lower())
+        if reader is None:
+            raise CommandError('Поддерживаются только файлы json и csv')
         try:
-            with open(os.path.join(DATA_ROOT, options['filename']), 'r',
-                      encoding='utf-8') as f:
-                data = json.load(f)
-                for ingredient in data:
-                    try:
-                        Ingredient.objects.create(name=ingredient["name"],
-                                                  measurement_unit=ingredient[
-                                                      "measurement_unit"])
-                    except IntegrityError:
-                        print(f'Ингридиет {ingredient["name"]} '
-                              f'{ingredient["measurement_unit"]} '
-                              f'уже есть в базе')
-
+            with open(path, 'r', encoding='utf-8-sig') as f:
+                total, inserted = self.load(reader(f), options['batch_size'])
         except FileNotFoundError:
             raise CommandError('Файл отсутствует в директории data')
+        bump_version(INGREDIENTS_VERSION)
+        self.stdout.write(
+            f'Загружено ингредиентов: {inserted}, '
+            f'пропущено как уже существующие: {total - inserted}'
+        )
+
+    @transaction.atomic
+    def load(self, rows, batch_size):
+        ingredients = (
+            Ingredient(name=row['name'].strip(),
+                       measurement_unit=row['measurement_unit'].strip())
+            for row in rows
+        )
+        before = Ingredient.objects.count()
+        total = 0
+        while True:
+            batch = list(islice(ingredients, batch_size))
+            if not batch:
+                break
+            Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+            total += len(batch)
+        return total, Ingredient.objects.count() - before
@@ -0,0 +1,42 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from recipe.images import enqueue, pending_tasks, run_task
+from recipe.models import Recipe, RecipeImageTask
+
+
+class Command(BaseCommand):
+    help = 'generating resized variants of recipe images from the queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', default=2, type=int)
+        parser.add_argument('--enqueue-missing', action='store_true',
+                            help='поставить в очередь рецепты без копий')
+        parser.add_argument('--loop', action='store_true',
+                            help='обрабатывать очередь непрерывно')
+        parser.add_argument('--interval', default=5, type=float,
+                            help='пауза между проверками очереди, секунды')
+
+    def handle(self, *args, **options):
+        if options['enqueue_missing']:
+            recipes = Recipe.objects.exclude(image='').exclude(
+                image__isnull=True
+            ).filter(image_thumbnail='').exclude(
+                id__in=RecipeImageTask.objects.values('recipe_id')
+            )
+            for recipe in recipes.iterator():
+                enqueue(recipe)
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            while True:
+                recipe_ids = list(
+                    pending_tasks().values_list('recipe_id', flat=True)
+                )
+                list(pool.map(run_task, recipe_ids))
+                if recipe_ids:
+                    self.stdout.write(
+                        f'Обработано изображений: {len(recipe_ids)}'
+                    )
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
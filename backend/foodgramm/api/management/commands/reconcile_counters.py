@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from recipe.models import FavoriteList, Recipe, ShoppingList
+from users.models import Follow, User
+
+
+def count_subquery(model, field):
+    """Подзапрос с количеством строк model, ссылающихся на объект.
+    """
+    return Coalesce(Subquery(
+        model.objects.filter(
+            **{field: OuterRef('pk')}
+        ).order_by().values(field).annotate(
+            total=Count('pk')
+        ).values('total')
+    ), 0)
+
+
+COUNTERS = (
+    (Recipe, 'favorites_count', FavoriteList, 'recipe'),
+    (Recipe, 'in_carts_count', ShoppingList, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Follow, 'author'),
+    (User, 'following_count', Follow, 'user'),
+)
+
+
+class Command(BaseCommand):
+    help = 'recalculating denormalized counters of recipes and users'
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        for model, counter, source, field in COUNTERS:
+            actual = count_subquery(source, field)
+            drifted = model.objects.annotate(actual=actual).exclude(
+                **{counter: F('actual')}
+            ).count()
+            if drifted:
+                model.objects.update(**{counter: actual})
+            self.stdout.write(
+                f'{model.__name__}.{counter}: исправлено {drifted}'
+            )
@@ -0,0 +1,21 @@
+import time
+
+from api.cache import SCORES_VERSION, bump_version
+from django.core.management.base import BaseCommand
+from recipe.scores import refresh_scores
+
+
+class Command(BaseCommand):
+    help = 'recalculating popularity scores of recipes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        processed = refresh_scores(options['batch_size'])
+        bump_version(SCORES_VERSION)
+        self.stdout.write(
+            f'Обработано рецептов: {processed} '
+            f'за {time.perf_counter() - started:.1f} с'
+        )
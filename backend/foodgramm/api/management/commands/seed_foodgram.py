@@ -0,0 +1,161 @@
+import random
+from itertools import islice
+from uuid import uuid4
+
+from api.cache import RECIPES_VERSION, SEARCH_VERSION, bump_versions
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipe.models import (FavoriteList, Ingredient, IngredientAmount, Recipe,
+                           ShoppingList, Tag)
+from recipe.search import update_search_vectors
+from users.models import Follow, User
+
+DEFAULT_TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+)
+SEED_DISHES = (
+    'суп', 'салат', 'пирог', 'каша', 'запеканка', 'омлет', 'рагу', 'паста',
+)
+SEED_PASSWORD = 'seed-password'
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Command(BaseCommand):
+    help = 'generating synthetic users, recipes, follows, favorites and carts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', default=100, type=int)
+        parser.add_argument('--recipes', default=1000, type=int)
+        parser.add_argument('--follows-per-user', default=10, type=int)
+        parser.add_argument('--favorites-per-user', default=10, type=int)
+        parser.add_argument('--cart-per-user', default=5, type=int)
+        parser.add_argument('--ingredients-per-recipe', default=6, type=int)
+        parser.add_argument('--tags-per-recipe', default=2, type=int)
+        parser.add_argument('--batch-size', default=1000, type=int)
+        parser.add_argument('--seed', type=int)
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.run = uuid4().hex[:6]
+        if not Ingredient.objects.exists():
+            call_command('load_ingredients', stdout=self.stdout)
+        for name, color, slug in DEFAULT_TAGS:
+            Tag.objects.get_or_create(
+                slug=slug, defaults={'name': name, 'color': color}
+            )
+        tag_ids = list(Tag.objects.values_list('id', flat=True))
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+
+        user_ids = self.create_users(options['users'])
+        recipe_ids = self.create_recipes(options['recipes'], user_ids)
+        self.create_links(
+            Recipe.tags.through, recipe_ids, 'recipe_id', tag_ids, 'tag_id',
+            options['tags_per_recipe']
+        )
+        self.create_amounts(
+            recipe_ids, ingredient_ids, options['ingredients_per_recipe']
+        )
+        self.create_links(
+            Follow, user_ids, 'user_id', user_ids, 'author_id',
+            options['follows_per_user'], exclude_self=True
+        )
+        self.create_links(
+            FavoriteList, user_ids, 'user_id', recipe_ids, 'recipe_id',
+            options['favorites_per_user']
+        )
+        self.create_links(
+            ShoppingList, user_ids, 'user_id', recipe_ids, 'recipe_id',
+            options['cart_per_user']
+        )
+        call_command('reconcile_counters', stdout=self.stdout)
+        call_command('build_timelines', stdout=self.stdout)
+        call_command('refresh_recipe_scores', stdout=self.stdout)
+        update_search_vectors(
+            Recipe.objects.filter(name__startswith=f'Рецепт {self.run} ')
+        )
+        bump_versions((RECIPES_VERSION, SEARCH_VERSION))
+        self.stdout.write(
+            f'Создано пользователей: {len(user_ids)}, '
+            f'рецептов: {len(recipe_ids)}. Пароль: {SEED_PASSWORD}'
+        )
+
+    def bulk_create(self, model, objects, **kwargs):
+        for batch in batched(objects, self.batch_size):
+            model.objects.bulk_create(batch, **kwargs)
+
+    def create_users(self, count):
+        password = make_password(SEED_PASSWORD)
+        prefix = f'seed{self.run}'
+        self.bulk_create(User, (
+            User(
+                username=f'{prefix}_{number}',
+                email=f'{prefix}_{number}@example.com',
+                first_name='Пользователь',
+                last_name=str(number),
+                password=password,
+            ) for number in range(count)
+        ))
+        return list(User.objects.filter(
+            username__startswith=f'{prefix}_'
+        ).values_list('id', flat=True))
+
+    def create_recipes(self, count, user_ids):
+        if not user_ids:
+            return []
+        self.bulk_create(Recipe, (
+            Recipe(
+                name=f'Рецепт {self.run} {number}',
+                text=(
+                    f'{self.random.choice(SEED_DISHES).capitalize()}: '
+                    'синтетический рецепт для нагрузочного тестирования.'
+                ),
+                author_id=self.random.choice(user_ids),
+                image='recipes/seed.png',
+                cooking_time=self.random.randint(1, 180),
+            ) for number in range(count)
+        ))
+        return list(Recipe.objects.filter(
+            name__startswith=f'Рецепт {self.run} '
+        ).values_list('id', flat=True))
+
+    def sample(self, population, count, exclude=None):
+        count = min(count, len(population) - (exclude is not None))
+        if count <= 0:
+            return []
+        chosen = self.random.sample(population, count + 1)
+        return [item for item in chosen if item != exclude][:count]
+
+    def create_links(self, model, sources, source_field, targets,
+                     target_field, per_source, exclude_self=False):
+        self.bulk_create(model, (
+            model(**{source_field: source, target_field: target})
+            for source in sources
+            for target in self.sample(
+                targets, per_source, source if exclude_self else None
+            )
+        ), ignore_conflicts=True)
+
+    def create_amounts(self, recipe_ids, ingredient_ids, per_recipe):
+        self.bulk_create(IngredientAmount, (
+            IngredientAmount(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=self.random.randint(1, 256),
+            )
+            for recipe_id in recipe_ids
+            for ingredient_id in self.sample(ingredient_ids, per_recipe)
+        ))
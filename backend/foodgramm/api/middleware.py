@@ -0,0 +1,140 @@
+import json
+import logging
+import random
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('api.profiling')
+
+
+class QueryProfile:
+    """Запросы к БД и время этапов обработки одного HTTP-запроса.
+    Экземпляр подключается к соединениям как execute_wrapper.
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = Counter()
+        self.db_time = 0.0
+        self.view = None
+        self.view_started = None
+        self.view_db_time = 0.0
+        self.serialize_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries[sql] += 1
+
+    def start_view(self, name):
+        self.view = name
+        self.view_started = time.perf_counter()
+        self.view_db_time = self.db_time
+
+    def finish_view(self):
+        """Время представления и отрисовки ответа без ожидания БД:
+        в основном это работа сериализаторов над загруженными объектами.
+        """
+        if self.view_started is None:
+            return
+        self.serialize_time += (
+            time.perf_counter() - self.view_started
+            - (self.db_time - self.view_db_time)
+        )
+        self.view_started = None
+
+    @property
+    def duplicates(self):
+        """Повторы одного и того же SQL с разными параметрами — признак N+1.
+        """
+        return {sql: count for sql, count in self.queries.items() if count > 1}
+
+    def summary(self, request, response):
+        duplicates = self.duplicates
+        return {
+            'view': self.view,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': sum(self.queries.values()),
+            'duplicate_queries': sum(duplicates.values()) - len(duplicates),
+            'db_ms': round(self.db_time * 1000, 2),
+            'serialize_ms': round(self.serialize_time * 1000, 2),
+            'wall_ms': round((time.perf_counter() - self.started) * 1000, 2),
+        }
+
+
+class QueryProfilingMiddleware:
+    """Профилирование выборки запросов по PROFILING_SAMPLE_RATE:
+    число запросов к БД, время БД, сериализации и общее время.
+    Результат пишется JSON-строкой в логгер api.profiling и, если включён
+    PROFILING_RESPONSE_HEADER, в заголовок Server-Timing.
+    Тело StreamingHttpResponse читается уже после middleware
+    и в замеры не входит.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        rate = settings.PROFILING_SAMPLE_RATE
+        if rate <= 0 or random.random() >= rate:
+            return self.get_response(request)
+        profile = QueryProfile()
+        request._profile = profile
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(profile))
+            response = self.get_response(request)
+        profile.finish_view()
+        summary = profile.summary(request, response)
+        if settings.PROFILING_RESPONSE_HEADER:
+            response['Server-Timing'] = self.server_timing(summary)
+        self.report(summary, profile)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        profile = getattr(request, '_profile', None)
+        if profile is not None:
+            profile.start_view(self.view_name(request, view_func))
+
+    def process_template_response(self, request, response):
+        profile = getattr(request, '_profile', None)
+        if profile is not None:
+            response.add_post_render_callback(
+                lambda rendered: profile.finish_view()
+            )
+        return response
+
+    def view_name(self, request, view_func):
+        """Имя вида «ViewSet.action», например RecipeViewSet.list.
+        """
+        view_class = getattr(view_func, 'cls', None)
+        if view_class is None:
+            return getattr(view_func, '__name__', repr(view_func))
+        method = request.method.lower()
+        action = (getattr(view_func, 'actions', None) or {}).get(method)
+        return f'{view_class.__name__}.{action or method}'
+
+    def report(self, summary, profile):
+        if summary['duplicate_queries']:
+            sql, count = max(
+                profile.duplicates.items(), key=lambda item: item[1]
+            )
+            summary['top_duplicate'] = {'sql': sql, 'count': count}
+            logger.warning(json.dumps(summary, ensure_ascii=False))
+            return
+        logger.info(json.dumps(summary, ensure_ascii=False))
+
+    def server_timing(self, summary):
+        return (
+            f'db;dur={summary["db_ms"]};desc="{summary["queries"]} queries, '
+            f'{summary["duplicate_queries"]} duplicates", '
+            f'serialize;dur={summary["serialize_ms"]}, '
+            f'total;dur={summary["wall_ms"]}'
+        )
@@ -0,0 +1,106 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+
+from .cache import get_version
+
+
+class CachedReadMixin:
+    """Кэширование ответов справочников.
+    Готовый JSON хранится в кэше под текущими версиями наборов данных
+    из cache_version_names и отдаётся со строгим ETag. Если клиент прислал
+    совпадающий If-None-Match, возвращается 304 без тела.
+    """
+    cache_version_names = ()
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, super().list, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, super().retrieve, *args, **kwargs
+        )
+
+    def is_cacheable(self, request):
+        return request.accepted_renderer.format == 'json'
+
+    def get_cache_path(self, request):
+        """Часть ключа кэша, описывающая сам запрос.
+        """
+        return request.get_full_path()
+
+    def get_cache_timeout(self):
+        return settings.REFERENCE_CACHE_TIMEOUT
+
+    def get_cache_version_names(self, request):
+        return self.cache_version_names
+
+    def get_cache_key(self, request):
+        versions = ':'.join(
+            f'{name}={get_version(name)}'
+            for name in self.get_cache_version_names(request)
+        )
+        return f'response:{versions}:{self.get_cache_path(request)}'
+
+    def cached_response(self, request, view, *args, **kwargs):
+        if not self.is_cacheable(request):
+            return view(request, *args, **kwargs)
+        key = self.get_cache_key(request)
+        cached = cache.get(key)
+        if cached is None:
+            response = view(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            content = request.accepted_renderer.render(
+                response.data, request.accepted_media_type,
+                self.get_renderer_context()
+            )
+            etag = quote_etag(hashlib.sha1(content).hexdigest())
+            cached = (etag, content)
+            cache.set(key, cached, self.get_cache_timeout())
+        etag, content = cached
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match and (
+            etag in parse_etags(if_none_match) or if_none_match == '*'
+        ):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = HttpResponse(content, content_type='application/json')
+        response['ETag'] = etag
+        return response
+
+
+class AnonymousFeedCacheMixin(CachedReadMixin):
+    """Кэширование списка для анонимных пользователей.
+    Ключ строится только из параметров cache_query_params: значения
+    отсортированы, прочие параметры не влияют на ответ и отбрасываются.
+    Адрес сервера входит в ключ, потому что ссылки пагинации абсолютные.
+    """
+    cache_query_params = ()
+
+    def is_cacheable(self, request):
+        return (
+            self.action == 'list'
+            and request.user.is_anonymous
+            and super().is_cacheable(request)
+        )
+
+    def get_cache_path(self, request):
+        params = '&'.join(
+            f'{name}={",".join(sorted(set(values)))}'
+            for name, values in sorted(
+                (name, request.query_params.getlist(name))
+                for name in self.cache_query_params
+                if name in request.query_params
+            )
+        )
+        return f'{request.build_absolute_uri(request.path)}?{params}'
+
+    def get_cache_timeout(self):
+        return settings.RECIPE_FEED_CACHE_TIMEOUT
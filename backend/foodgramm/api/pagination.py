@@ -1,5 +1,181 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import binascii
+import hashlib
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+def cached_count(queryset):
+    """Количество объектов без вычисления аннотаций выборки.
+    Результат кэшируется на короткое время по тексту SQL-запроса.
+    """
+    queryset = queryset.order_by().values('pk')
+    try:
+        sql = str(queryset.query)
+    except EmptyResultSet:
+        return 0
+    key = f'count:{hashlib.md5(sql.encode()).hexdigest()}'
+    return cache.get_or_set(
+        key, queryset.count, settings.PAGINATION_COUNT_CACHE_TIMEOUT
+    )
+
+
+class CountPaginator(Paginator):
+    """Пагинатор, который считает объекты без аннотаций выборки.
+    Количество не кэшируется: по нему Paginator обрезает страницу,
+    и устаревшее значение скрыло бы сами объекты.
+    """
+    @cached_property
+    def count(self):
+        return self.object_list.order_by().values('pk').count()
+
+
+class KeysetPagination(BasePagination):
+    """Keyset-пагинация для бесконечной ленты.
+    Следующая страница выбирается условием по полям сортировки
+    последнего объекта, поэтому её стоимость не зависит от глубины.
+    Общее количество объектов только отображается в ответе,
+    поэтому кэшируется на короткое время.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = 100
+    ordering = ('-id',)
+    invalid_cursor_message = 'Некорректный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.count = self.get_count(queryset)
+        self.fields = [
+            queryset.model._meta.get_field(name.lstrip('-'))
+            for name in self.ordering
+        ]
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self.position_filter(position))
+        page = list(queryset[:self.page_size + 1])
+        self.next_position = None
+        if len(page) > self.page_size:
+            page = page[:self.page_size]
+            self.next_position = [
+                field.value_to_string(page[-1]) for field in self.fields
+            ]
+        return page
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_count(self, queryset):
+        return cached_count(queryset)
+
+    def position_filter(self, position):
+        """Условие «строго после позиции» для составного ключа.
+        """
+        condition = Q()
+        equal = Q()
+        for name, field, value in zip(self.ordering, self.fields, position):
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{field.attname}__{lookup}': value})
+            equal &= Q(**{field.attname: value})
+        return condition
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            raw = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            if len(raw) != len(self.fields):
+                raise ValueError
+            return [
+                field.to_python(value)
+                for field, value in zip(self.fields, raw)
+            ]
+        except (TypeError, ValueError, ValidationError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position):
+        return base64.urlsafe_b64encode(
+            json.dumps(position).encode()
+        ).decode()
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.next_position)
+        )
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('next', self.get_next_link()),
+            ('previous', None),
+            ('results', data),
+        ]))
+
+
+class RecipeKeysetPagination(KeysetPagination):
+    ordering = ('-pub_date', '-id')
 
 
 class CustomPagination(PageNumberPagination):
+    """Постраничная пагинация.
+    Если задан keyset_class и в запросе есть параметр cursor
+    (для первой страницы — пустой), используется keyset-пагинация.
+    """
+    django_paginator_class = CountPaginator
     page_size_query_param = 'limit'
+    keyset_class = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if (self.keyset_class is not None
+                and self.keyset_class.cursor_query_param
+                in request.query_params):
+            self.keyset = self.keyset_class()
+            self.display_page_controls = False
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class ListPagination(PageNumberPagination):
+    """Постраничная пагинация готового списка объектов.
+    """
+    page_size_query_param = 'limit'
+
+
+class RecipePagination(CustomPagination):
+    keyset_class = RecipeKeysetPagination
+
+
+class SubscriptionPagination(CustomPagination):
+    keyset_class = KeysetPagination
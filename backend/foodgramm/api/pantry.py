@@ -0,0 +1,137 @@
+import threading
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+from itertools import chain
+from operator import truediv
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from recipe.models import IngredientAmount
+
+SEQUENCE_KEY = 'pantry:sequence'
+
+
+def _change_key(sequence):
+    return f'pantry:change:{sequence}'
+
+
+def record_changes(recipe_ids):
+    """Запись рецептов с изменёнными ингредиентами в общий журнал
+    после фиксации транзакции. По журналу индексы всех процессов
+    обновляют только эти рецепты.
+    """
+    recipe_ids = list(recipe_ids)
+
+    def record():
+        cache.add(SEQUENCE_KEY, 0, timeout=None)
+        sequence = cache.incr(SEQUENCE_KEY)
+        cache.set(
+            _change_key(sequence), recipe_ids, settings.PANTRY_CHANGES_TIMEOUT
+        )
+
+    transaction.on_commit(record)
+
+
+class PantryIndex:
+    """Обратный индекс «ингредиент → отсортированный массив рецептов»
+    в памяти процесса и наборы ингредиентов каждого рецепта.
+    Изменения применяются по журналу record_changes; если записи журнала
+    потеряны или их слишком много, индекс строится заново.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sequence = None
+        self._postings = {}
+        self._recipes = {}
+        self._counts = {}
+
+    def _build(self, sequence):
+        postings = defaultdict(list)
+        recipes = defaultdict(list)
+        for recipe_id, ingredient_id in IngredientAmount.objects.order_by(
+            'recipe_id'
+        ).values_list('recipe_id', 'ingredient_id').iterator():
+            postings[ingredient_id].append(recipe_id)
+            recipes[recipe_id].append(ingredient_id)
+        self._postings = {
+            ingredient_id: array('q', recipe_ids)
+            for ingredient_id, recipe_ids in postings.items()
+        }
+        self._recipes = {
+            recipe_id: tuple(ingredient_ids)
+            for recipe_id, ingredient_ids in recipes.items()
+        }
+        self._counts = {
+            recipe_id: len(ingredient_ids)
+            for recipe_id, ingredient_ids in recipes.items()
+        }
+        self._sequence = sequence
+
+    def _apply(self, recipe_ids, sequence):
+        current = defaultdict(list)
+        for recipe_id, ingredient_id in IngredientAmount.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('recipe_id', 'ingredient_id'):
+            current[recipe_id].append(ingredient_id)
+        for recipe_id in recipe_ids:
+            self._counts.pop(recipe_id, None)
+            for ingredient_id in self._recipes.pop(recipe_id, ()):
+                posting = self._postings[ingredient_id]
+                del posting[bisect_left(posting, recipe_id)]
+            if recipe_id not in current:
+                continue
+            self._recipes[recipe_id] = tuple(current[recipe_id])
+            self._counts[recipe_id] = len(current[recipe_id])
+            for ingredient_id in current[recipe_id]:
+                insort(
+                    self._postings.setdefault(ingredient_id, array('q')),
+                    recipe_id
+                )
+        self._sequence = sequence
+
+    def _ensure_fresh(self):
+        sequence = cache.get(SEQUENCE_KEY, 0)
+        if sequence == self._sequence:
+            return
+        if (self._sequence is None or sequence < self._sequence
+                or sequence - self._sequence
+                > settings.PANTRY_MAX_PENDING_CHANGES):
+            self._build(sequence)
+            return
+        keys = [
+            _change_key(number)
+            for number in range(self._sequence + 1, sequence + 1)
+        ]
+        changes = cache.get_many(keys)
+        if len(changes) < len(keys):
+            self._build(sequence)
+            return
+        self._apply(set(chain.from_iterable(changes.values())), sequence)
+
+    def match(self, ingredient_ids, limit):
+        """Не больше limit рецептов, в которых есть хотя бы один
+        из ингредиентов: кортежи (рецепт, найдено, всего ингредиентов),
+        сначала рецепты с наибольшей долей найденных ингредиентов.
+        Подсчёт и сортировка выполняются встроенными функциями без цикла
+        на Python по каждому рецепту.
+        """
+        with self._lock:
+            self._ensure_fresh()
+            matched = Counter()
+            for ingredient_id in set(ingredient_ids):
+                matched.update(self._postings.get(ingredient_id, ()))
+            recipe_ids = list(matched)
+            found = list(matched.values())
+            totals = list(map(self._counts.__getitem__, recipe_ids))
+            best = sorted(zip(
+                map(truediv, found, totals), found, recipe_ids, totals
+            ), reverse=True)[:limit]
+            return [
+                (recipe_id, count, total)
+                for _, count, recipe_id, total in best
+            ]
+
+
+pantry_index = PantryIndex()
@@ -0,0 +1,142 @@
+import heapq
+import re
+import threading
+from collections import defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import Case, F, FloatField, Value, When
+from recipe.models import Ingredient, IngredientAmount, Recipe
+from recipe.search import uses_search_vector
+
+from .cache import INGREDIENTS_VERSION, SEARCH_VERSION, get_versions
+
+WORD = re.compile(r'\w+')
+# Окончания отбрасываются от длинных к коротким, основа не короче трёх букв.
+ENDINGS = sorted((
+    'иями', 'ями', 'ами', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими',
+    'ой', 'ей', 'ий', 'ый', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ам',
+    'ям', 'ах', 'ях', 'ом', 'ем', 'ов', 'ев', 'ью', 'а', 'я', 'о', 'е',
+    'ы', 'и', 'у', 'ю', 'ь',
+), key=len, reverse=True)
+# Веса полей совпадают с весами A, B и C в ts_rank.
+NAME_WEIGHT = 1.0
+TEXT_WEIGHT = 0.4
+INGREDIENT_WEIGHT = 0.2
+
+
+@lru_cache(maxsize=100000)
+def stem(word):
+    for ending in ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= 3:
+            return word[:-len(ending)]
+    return word
+
+
+def tokenize(text):
+    return {
+        stem(word) for word in WORD.findall(
+            (text or '').lower().replace('ё', 'е')
+        )
+    }
+
+
+class RecipeSearchIndex:
+    """Обратный индекс рецептов в памяти процесса для баз
+    без полнотекстового поиска. Для каждой основы слова хранится
+    словарь «рецепт → вес», поэтому поиск просматривает только рецепты
+    с самым редким словом запроса. Индекс перестраивается, когда меняются
+    тексты рецептов или справочник ингредиентов.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._postings = {}
+
+    def _build(self, version):
+        postings = defaultdict(dict)
+
+        def add(recipe_id, terms, weight):
+            for term in terms:
+                scores = postings[term]
+                scores[recipe_id] = scores.get(recipe_id, 0) + weight
+
+        for recipe_id, name, text in Recipe.objects.order_by().values_list(
+            'id', 'name', 'text'
+        ).iterator():
+            add(recipe_id, tokenize(name), NAME_WEIGHT)
+            add(recipe_id, tokenize(text), TEXT_WEIGHT)
+        ingredient_terms = {
+            ingredient_id: tokenize(name)
+            for ingredient_id, name in Ingredient.objects.values_list(
+                'id', 'name'
+            )
+        }
+        for recipe_id, ingredient_id in IngredientAmount.objects.order_by(
+        ).values_list('recipe_id', 'ingredient_id').iterator():
+            add(recipe_id, ingredient_terms.get(ingredient_id, ()),
+                INGREDIENT_WEIGHT)
+        self._postings = dict(postings)
+        self._version = version
+
+    def _ensure_fresh(self):
+        versions = get_versions((SEARCH_VERSION, INGREDIENTS_VERSION))
+        version = (versions[SEARCH_VERSION], versions[INGREDIENTS_VERSION])
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._build(version)
+
+    def search(self, query, limit):
+        """Не больше limit рецептов, содержащих все слова запроса:
+        словарь «рецепт → ранг», при равном ранге выше новые рецепты.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return {}
+        self._ensure_fresh()
+        postings = sorted(
+            (self._postings.get(term, {}) for term in terms), key=len
+        )
+        ranks = dict(postings[0])
+        for scores in postings[1:]:
+            ranks = {
+                recipe_id: rank + scores[recipe_id]
+                for recipe_id, rank in ranks.items() if recipe_id in scores
+            }
+        return dict(heapq.nlargest(
+            limit, ranks.items(), key=lambda item: (item[1], item[0])
+        ))
+
+
+recipe_search_index = RecipeSearchIndex()
+
+
+def search_recipes(queryset, query):
+    """Рецепты, подходящие под запрос, в порядке убывания ранга.
+    В PostgreSQL используется search_vector с GIN-индексом, в остальных
+    базах — индекс в памяти, который отдаёт не больше
+    RECIPE_SEARCH_FALLBACK_LIMIT лучших рецептов.
+    """
+    ordering = ('-search_rank', '-pub_date', '-id')
+    if uses_search_vector():
+        query = SearchQuery(query, config=settings.RECIPE_SEARCH_CONFIG)
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query)
+        ).order_by(*ordering)
+    ranks = recipe_search_index.search(
+        query, settings.RECIPE_SEARCH_FALLBACK_LIMIT
+    )
+    if not ranks:
+        return queryset.none()
+    groups = defaultdict(list)
+    for recipe_id, rank in ranks.items():
+        groups[rank].append(recipe_id)
+    return queryset.filter(pk__in=list(ranks)).annotate(
+        search_rank=Case(
+            *(When(pk__in=ids, then=Value(rank))
+              for rank, ids in groups.items()),
+            output_field=FloatField(),
+        )
+    ).order_by(*ordering)
@@ -1,10 +1,29 @@
-from django.core.exceptions import ObjectDoesNotExist
+import base64
+import binascii
+import os
+import struct
+import warnings
+from collections import OrderedDict
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.db import transaction
+from django.db.models import Manager, Prefetch, prefetch_related_objects
 from django.shortcuts import get_object_or_404
 from drf_extra_fields.fields import Base64ImageField
+from PIL import Image
+from recipe import images
 from recipe.models import (FavoriteList, Ingredient, IngredientAmount, Recipe,
                            ShoppingList, Tag)
 from rest_framework import serializers
-from users.models import Follow, User
+from users.models import User
+
+from .cache import (INGREDIENTS_VERSION, TAGS_VERSION, get_versions,
+                    recipe_version_name, user_version_name)
+from .services import latest_recipes
+from .viewer import get_viewer
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -29,11 +48,11 @@ class UserSerializer(serializers.ModelSerializer):
     def get_is_subscribed(self, obj):
         """Проверка подписки пользователя
         """
-        request = self.context.get('request')
-        if request is None or request.user.is_anonymous:
-            return False
-        return Follow.objects.filter(user=request.user,
-                                     author=obj.id).exists()
+        annotated = getattr(obj, 'is_subscribed', None)
+        if annotated is not None:
+            return annotated
+        viewer = get_viewer(self.context.get('request'))
+        return viewer.is_subscribed(obj.id)
 
     def create(self, validated_data):
         """Создание нового пользователя с запрошенными полями
@@ -49,10 +68,126 @@ class UserSerializer(serializers.ModelSerializer):
         return user
 
 
+class ImageVariantField(serializers.ImageField):
+    """Ссылка на уменьшенную копию изображения рецепта.
+    Пока копия не готова, отдаётся ссылка на оригинал.
+    """
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def get_attribute(self, instance):
+        return super().get_attribute(instance) or instance.image
+
+
+class StreamingBase64ImageField(serializers.ImageField):
+    """Изображение в base64, которое декодируется частями сразу
+    во временный файл. Формат и размеры проверяются по заголовку,
+    как только он записан, до полного декодирования изображения.
+    """
+    FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif'}
+    default_error_messages = {
+        'invalid_base64': 'Изображение должно быть строкой base64.',
+        'too_large': 'Размер изображения не должен превышать {max_size} Мб.',
+        'too_many_pixels': (
+            'Изображение не должно быть больше {max_pixels} пикселей.'
+        ),
+    }
+
+    def to_internal_value(self, data):
+        if not isinstance(data, str):
+            self.fail('invalid_base64')
+        start = data.find(';base64,')
+        start = 0 if start == -1 else start + len(';base64,')
+        if (len(data) - start) * 3 // 4 > (
+            settings.RECIPE_IMAGE_MAX_UPLOAD_SIZE
+        ):
+            self.fail(
+                'too_large',
+                max_size=settings.RECIPE_IMAGE_MAX_UPLOAD_SIZE // 2 ** 20,
+            )
+        file = TemporaryUploadedFile(str(uuid4()), None, 0, None)
+        try:
+            image_format = self.decode(data, start, file)
+        except serializers.ValidationError:
+            file.close()
+            raise
+        if image_format is None:
+            file.close()
+            self.fail('invalid_image')
+        file.name = f'{uuid4()}.{self.FORMATS[image_format]}'
+        file.content_type = Image.MIME[image_format]
+        file.size = file.tell()
+        file.seek(0)
+        return super().to_internal_value(file)
+
+    def decode(self, data, start, file):
+        """Декодирование base64 частями по RECIPE_IMAGE_DECODE_CHUNK_SIZE
+        символов; в памяти одновременно находится только одна часть.
+        """
+        chunk_size = settings.RECIPE_IMAGE_DECODE_CHUNK_SIZE
+        image_format = None
+        for position in range(start, len(data), chunk_size):
+            try:
+                file.write(base64.b64decode(
+                    data[position:position + chunk_size], validate=True
+                ))
+            except (binascii.Error, ValueError):
+                self.fail('invalid_base64')
+            if image_format is None:
+                image_format = self.read_header(file)
+        return image_format
+
+    def read_header(self, file):
+        """Формат уже записанной части изображения или None,
+        если заголовок пока получен не полностью.
+        """
+        file.flush()
+        file.seek(0)
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+                image = Image.open(file.file, formats=list(self.FORMATS))
+        except Image.DecompressionBombError:
+            image = None
+        except (OSError, SyntaxError, ValueError, struct.error):
+            return None
+        finally:
+            file.seek(0, os.SEEK_END)
+        if image is None or (
+            image.width * image.height > settings.RECIPE_IMAGE_MAX_PIXELS
+        ):
+            self.fail(
+                'too_many_pixels',
+                max_pixels=settings.RECIPE_IMAGE_MAX_PIXELS,
+            )
+        return image.format
+
+
 class ShortRecipeSerializer(serializers.ModelSerializer):
+    image_thumbnail = ImageVariantField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_thumbnail', 'cooking_time')
+
+
+def get_recipes_limit(request):
+    """Проверенное значение параметра recipes_limit;
+    без параметра None — выводятся все рецепты автора.
+    """
+    value = request.query_params.get('recipes_limit') if request else None
+    if value in (None, ''):
+        return None
+    try:
+        limit = int(value)
+    except ValueError:
+        limit = -1
+    if limit < 0:
+        raise serializers.ValidationError({
+            'recipes_limit': 'Ожидалось неотрицательное целое число.'
+        })
+    return limit
 
 
 class UserFollowSerializer(UserSerializer):
@@ -81,20 +216,32 @@ class UserFollowSerializer(UserSerializer):
         )
         read_only_fields = '__all__',
 
-    def get_is_subcriber(self, obj):
-        return Follow.objects.filter(user=obj.user, author=obj.author
-                                     ).exists()
+    def get_is_subscribed(self, obj):
+        request = self.context.get('request')
+        if request is not None and obj.user_id == request.user.id:
+            return True
+        return get_viewer(request).is_subscribed(obj.author_id)
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        queryset = Recipe.objects.filter(author=obj.author)
-        if limit:
-            queryset = queryset[:int(limit)]
-        return ShortRecipeSerializer(queryset, many=True).data
+        """Последние рецепты автора.
+        Список подписок загружает их заранее в author.latest_recipes.
+        """
+        recipes = getattr(obj.author, 'latest_recipes', None)
+        if recipes is None:
+            limit = get_recipes_limit(self.context.get('request'))
+            recipes = latest_recipes([obj.author_id], limit)[obj.author_id]
+        return ShortRecipeSerializer(recipes, many=True).data
 
     def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj.author).count()
+        return obj.author.recipes_count
+
+
+class RecipeAuthorSerializer(UserSerializer):
+    """Автор в карточке рецепта.
+    Подписка зависит от пользователя и добавляется при выдаче карточки.
+    """
+    class Meta(UserSerializer.Meta):
+        fields = ('email', 'id', 'username', 'first_name', 'last_name')
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -117,11 +264,15 @@ class TagListField(serializers.RelatedField):
         }
 
     def to_internal_value(self, data):
+        """Тэги проверяются на существование одним запросом
+        в CreateUpdateRecipeSerializer.validate_tags
+        """
         try:
-            return Tag.objects.get(id=data)
-        except ObjectDoesNotExist:
+            return int(data)
+        except (TypeError, ValueError):
             raise serializers.ValidationError(
-                'Недопустимый первичный ключ "404" - объект не существует.'
+                f'Некорректный тип. Ожидалось значение первичного ключа, '
+                f'получен {type(data).__name__}.'
             )
 
 
@@ -157,12 +308,37 @@ class IngredientAmountSerializer(serializers.ModelSerializer):
         return self._get_ingredient(amount.ingredient.id).measurement_unit
 
 
+def recipe_card_prefetch():
+    return (
+        'tags',
+        Prefetch(
+            'ingredient_in_recipe',
+            queryset=IngredientAmount.objects.select_related('ingredient')
+        ),
+    )
+
+
+class RecipeCardListSerializer(serializers.ListSerializer):
+    """Список карточек рецептов: общие для всех части карточек
+    берутся из кэша одним обращением, сериализуются только промахи.
+    """
+    def to_representation(self, data):
+        recipes = list(data.all() if isinstance(data, Manager) else data)
+        cards = self.child.get_cards(recipes)
+        return [
+            self.child.personalize(cards[recipe.id], recipe)
+            for recipe in recipes
+        ]
+
+
 class RecipeListSerializer(serializers.ModelSerializer):
     """Сериализатор для получения списка рецептов
     """
     image = Base64ImageField(max_length=None, use_url=True)
+    image_thumbnail = ImageVariantField()
+    image_medium = ImageVariantField()
     tags = TagSerializer(read_only=True, many=True)
-    author = UserSerializer(read_only=True)
+    author = RecipeAuthorSerializer(read_only=True)
     ingredients = IngredientAmountSerializer(
         many=True,
         source='ingredient_in_recipe',
@@ -173,6 +349,7 @@ class RecipeListSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Recipe
+        list_serializer_class = RecipeCardListSerializer
         fields = (
             'id',
             'tags',
@@ -182,6 +359,8 @@ class RecipeListSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_thumbnail',
+            'image_medium',
             'text',
             'cooking_time',
         )
@@ -191,23 +370,103 @@ class RecipeListSerializer(serializers.ModelSerializer):
             'is_shopping_cart',
         )
 
+    def to_representation(self, instance):
+        card = self.get_cards([instance])[instance.id]
+        return self.personalize(card, instance)
+
+    def card_keys(self, recipes):
+        """Ключи карточек: версия рецепта, автора, тегов и ингредиентов.
+        Адрес сервера входит в ключ из-за абсолютной ссылки на изображение.
+        """
+        names = {TAGS_VERSION, INGREDIENTS_VERSION}
+        for recipe in recipes:
+            names.add(recipe_version_name(recipe.id))
+            names.add(user_version_name(recipe.author_id))
+        versions = get_versions(names)
+        request = self.context.get('request')
+        base = request.build_absolute_uri('/') if request else ''
+        common = (
+            f'{versions.get(TAGS_VERSION)}:'
+            f'{versions.get(INGREDIENTS_VERSION)}:{base}'
+        )
+        return {
+            recipe.id: (
+                f'recipe_card:{recipe.id}:'
+                f'{versions.get(recipe_version_name(recipe.id))}:'
+                f'{versions.get(user_version_name(recipe.author_id))}:'
+                f'{common}'
+            )
+            for recipe in recipes
+        }
+
+    def get_cards(self, recipes):
+        keys = self.card_keys(recipes)
+        cards = cache.get_many(keys.values())
+        cards = {
+            recipe.id: cards[keys[recipe.id]]
+            for recipe in recipes if keys[recipe.id] in cards
+        }
+        missing = [recipe for recipe in recipes if recipe.id not in cards]
+        if missing:
+            prefetch_related_objects(missing, *recipe_card_prefetch())
+            fresh = {recipe.id: self.card(recipe) for recipe in missing}
+            cache.set_many(
+                {keys[recipe_id]: card for recipe_id, card in fresh.items()},
+                settings.RECIPE_CARD_CACHE_TIMEOUT
+            )
+            cards.update(fresh)
+        return cards
+
+    def card(self, instance):
+        """Не зависящая от пользователя часть карточки рецепта.
+        """
+        card = super().to_representation(instance)
+        for name in ('is_favorited', 'is_in_shopping_cart'):
+            card.pop(name)
+        return card
+
+    def personalize(self, card, instance):
+        """Карточка из кэша с флагами текущего пользователя.
+        """
+        flags = {
+            'is_favorited': self.get_is_favorited(instance),
+            'is_in_shopping_cart': self.get_is_in_shopping_cart(instance),
+        }
+        data = OrderedDict(
+            (name, flags[name] if name in flags else card[name])
+            for name in self.Meta.fields
+        )
+        if card['author'] is not None:
+            data['author'] = OrderedDict(
+                card['author'],
+                is_subscribed=self.get_author_subscribed(instance)
+            )
+        return data
+
+    def get_author_subscribed(self, obj):
+        annotated = getattr(obj, 'author_subscribed', None)
+        if annotated is not None:
+            return annotated
+        viewer = get_viewer(self.context.get('request'))
+        return viewer.is_subscribed(obj.author_id)
+
     def get_is_favorited(self, obj):
         """Проверка, находится ли рецепт в избранном
         """
-        request = self.context.get('request')
-        if request.user.is_authenticated:
-            return FavoriteList.objects.filter(user=request.user,
-                                               recipe=obj).exists()
-        return False
+        annotated = getattr(obj, 'favorited', None)
+        if annotated is not None:
+            return annotated
+        viewer = get_viewer(self.context.get('request'))
+        return viewer.is_favorited(obj.id)
 
     def get_is_in_shopping_cart(self, obj):
         """Проверка, находится ли рецепт в списке  покупок
         """
-        request = self.context.get('request')
-        if request.user.is_authenticated:
-            return ShoppingList.objects.filter(user=request.user,
-                                               recipe=obj).exists()
-        return False
+        annotated = getattr(obj, 'in_shopping_cart', None)
+        if annotated is not None:
+            return annotated
+        viewer = get_viewer(self.context.get('request'))
+        return viewer.is_in_shopping_cart(obj.id)
 
 
 class IngredientInRecipeWriteSerializer(serializers.ModelSerializer):
@@ -221,7 +480,7 @@ class IngredientInRecipeWriteSerializer(serializers.ModelSerializer):
 class CreateUpdateRecipeSerializer(serializers.ModelSerializer):
     """Сериализатор для создания и обновления рецептов
     """
-    image = Base64ImageField(max_length=None, use_url=True)
+    image = StreamingBase64ImageField(max_length=None, use_url=True)
     author = UserSerializer(read_only=True)
     ingredients = IngredientInRecipeWriteSerializer(many=True)
     tags = TagListField(queryset=Tag.objects.all(), many=True)
@@ -232,15 +491,87 @@ class CreateUpdateRecipeSerializer(serializers.ModelSerializer):
                   'is_in_shopping_cart', 'name', 'image', 'text',
                   'cooking_time')
 
+    def save(self, **kwargs):
+        """Временный файл изображения закрывается сразу после сохранения:
+        хранилище перемещает его на место, а не копирует.
+        """
+        try:
+            return super().save(**kwargs)
+        finally:
+            image = self.validated_data.get('image')
+            if image is not None:
+                image.close()
+
+    def validate_tags(self, tag_ids):
+        tags = Tag.objects.in_bulk(tag_ids)
+        missing = [tag_id for tag_id in tag_ids if tag_id not in tags]
+        if missing:
+            raise serializers.ValidationError(
+                f'Недопустимый первичный ключ "{missing[0]}" - '
+                f'объект не существует.'
+            )
+        return [tags[tag_id] for tag_id in dict.fromkeys(tag_ids)]
+
+    def validate_ingredients(self, ingredients):
+        ingredient_ids = [ingredient['id'] for ingredient in ingredients]
+        if len(set(ingredient_ids)) != len(ingredient_ids):
+            raise serializers.ValidationError(
+                'Ингредиенты в рецепте не должны повторяться.'
+            )
+        existing = Ingredient.objects.in_bulk(ingredient_ids)
+        missing = [pk for pk in ingredient_ids if pk not in existing]
+        if missing:
+            raise serializers.ValidationError(
+                f'Недопустимый первичный ключ "{missing[0]}" - '
+                f'объект не существует.'
+            )
+        return ingredients
+
     def create_ingredients(self, ingredients, recipe):
         IngredientAmount.objects.bulk_create(
             [IngredientAmount(
-                ingredient=Ingredient.objects.get(id=ingredient['id']),
+                ingredient_id=ingredient['id'],
                 recipe=recipe,
                 amount=ingredient['amount']
             ) for ingredient in ingredients]
         )
 
+    def update_ingredients(self, ingredients, recipe):
+        """Изменение только тех количеств ингредиентов,
+        которые отличаются от сохранённых.
+        """
+        amounts = {
+            ingredient['id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+        existing = {
+            ingredient_amount.ingredient_id: ingredient_amount
+            for ingredient_amount in IngredientAmount.objects.filter(
+                recipe=recipe
+            )
+        }
+        removed = [
+            ingredient_amount.id
+            for ingredient_id, ingredient_amount in existing.items()
+            if ingredient_id not in amounts
+        ]
+        changed = []
+        for ingredient_id, ingredient_amount in existing.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and amount != ingredient_amount.amount:
+                ingredient_amount.amount = amount
+                changed.append(ingredient_amount)
+        if removed:
+            IngredientAmount.objects.filter(id__in=removed).delete()
+        if changed:
+            IngredientAmount.objects.bulk_update(changed, ['amount'])
+        self.create_ingredients(
+            [ingredient for ingredient in ingredients
+             if ingredient['id'] not in existing],
+            recipe
+        )
+
+    @transaction.atomic
     def create(self, validated_data):
         """Создание рецепта
         """
@@ -250,12 +581,13 @@ class CreateUpdateRecipeSerializer(serializers.ModelSerializer):
         recipe = Recipe.objects.create(image=image, **validated_data)
         self.create_ingredients(ingredients=ingredients_data, recipe=recipe)
         recipe.tags.set(tags)
+        images.enqueue(recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         """Обновление рецепта
         """
-        tags = validated_data.pop('tags')
         instance.name = validated_data.get('name', instance.name)
         instance.image = validated_data.get('image', instance.image)
         instance.text = validated_data.get('text', instance.text)
@@ -263,10 +595,13 @@ class CreateUpdateRecipeSerializer(serializers.ModelSerializer):
             'cooking_time',
             instance.cooking_time
         )
-        IngredientAmount.objects.filter(recipe=instance).all().delete()
-        self.create_ingredients(validated_data.get('ingredients'), instance)
-        instance.tags.set(tags)
+        if 'ingredients' in validated_data:
+            self.update_ingredients(validated_data['ingredients'], instance)
+        if 'tags' in validated_data:
+            instance.tags.set(validated_data['tags'])
         instance.save()
+        if 'image' in validated_data:
+            images.enqueue(instance)
         return instance
 
     def to_representation(self, instance):
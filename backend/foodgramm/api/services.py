@@ -0,0 +1,203 @@
+import csv
+import hashlib
+import io
+import json
+import os
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import F, OuterRef, Subquery, Sum, Window
+from django.db.models.functions import RowNumber
+from fpdf import FPDF
+from recipe.models import IngredientAmount, Recipe
+
+from .units import ingredient_units
+
+SHOPPING_CART_FILENAME = 'shopping_card'
+SHOPPING_CART_TITLE = 'Список покупок'
+SHOPPING_CART_CONTENT_TYPES = {
+    'txt': 'text/plain; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+    'pdf': 'application/pdf',
+}
+
+
+def get_shopping_cart_ingredients(user):
+    """Суммарное количество ингредиентов из списка покупок пользователя:
+    строки (название, количество, единица). Суммы по ингредиентам
+    считаются одним запросом с GROUP BY, затем таблица ingredient_units
+    за один проход приводит их к общим единицам, поэтому дубликаты
+    ингредиента с разными единицами занимают одну строку. Результат —
+    список: строк в нём не больше, чем разных ингредиентов в корзине,
+    независимо от числа рецептов.
+    """
+    return ingredient_units.convert(IngredientAmount.objects.filter(
+        recipe__recipe_in_shoplist__user=user
+    ).order_by().values_list('ingredient_id').annotate(
+        total=Sum('amount')
+    ))
+
+
+def render_shopping_cart_txt(rows):
+    return ''.join(
+        f'{name}, {total} {unit}\n' for name, total, unit in rows
+    ).encode('utf-8')
+
+
+class ShoppingCartPDF(FPDF):
+    """PDF со списком покупок.
+    Метрики шрифта разбираются один раз на процесс, новые документы
+    получают копию уже загруженного шрифта.
+    """
+    unicode_font = 'DejaVu'
+    text_size = 12
+    title_size = 16
+    row_height = 8
+    amount_width = 40
+    _font_state = None
+
+    def __init__(self):
+        super().__init__()
+        self.unicode = self._load_font()
+        self.set_auto_page_break(True, margin=15)
+        self.add_page()
+        self.set_font(self.family, size=self.title_size)
+        self.cell(0, self.row_height * 2, self.prepare(SHOPPING_CART_TITLE),
+                  ln=1, align='C')
+        self.set_font(self.family, size=self.text_size)
+        self.name_width = self.w - self.l_margin - self.r_margin - (
+            self.amount_width
+        )
+
+    @property
+    def family(self):
+        return self.unicode_font if self.unicode else 'Helvetica'
+
+    def _load_font(self):
+        cls = type(self)
+        if cls._font_state is None:
+            font = settings.SHOPPING_CART_FONT
+            if not os.path.exists(font):
+                cls._font_state = False
+                return False
+            self.add_font(self.unicode_font, '', font, uni=True)
+            cls._font_state = (self.fonts, self.font_files)
+        if not cls._font_state:
+            return False
+        fonts, font_files = cls._font_state
+        self.fonts = {
+            key: dict(font, subset=list(font['subset']))
+            for key, font in fonts.items()
+        }
+        self.font_files = {
+            key: dict(font_file) for key, font_file in font_files.items()
+        }
+        return True
+
+    def prepare(self, text):
+        """Без юникодного шрифта FPDF умеет выводить только latin-1.
+        """
+        if self.unicode:
+            return text
+        return text.encode('latin-1', 'replace').decode('latin-1')
+
+    def add_row(self, name, total, unit):
+        self.cell(self.name_width, self.row_height, self.prepare(name),
+                  border='B')
+        self.cell(self.amount_width, self.row_height,
+                  self.prepare(f'{total} {unit}'), border='B', ln=1,
+                  align='R')
+
+    def render(self, rows):
+        for row in rows:
+            self.add_row(*row)
+        return self.output(dest='S').encode('latin-1')
+
+
+def render_shopping_cart_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(('name', 'amount', 'measurement_unit'))
+    writer.writerows(rows)
+    return buffer.getvalue().encode('utf-8')
+
+
+def render_shopping_cart_pdf(rows):
+    return ShoppingCartPDF().render(rows)
+
+
+SHOPPING_CART_RENDERERS = {
+    'txt': render_shopping_cart_txt,
+    'csv': render_shopping_cart_csv,
+    'pdf': render_shopping_cart_pdf,
+}
+
+
+def render_shopping_cart(ingredients, file_format):
+    """Файл списка покупок в формате txt, csv или pdf.
+    Готовый файл кэшируется по хэшу содержимого списка, повторная
+    выгрузка того же списка не требует повторного рендеринга.
+    """
+    digest = hashlib.sha256(
+        json.dumps(ingredients, ensure_ascii=False).encode('utf-8')
+    ).hexdigest()
+    key = f'shopping_cart:{file_format}:{digest}'
+    content = cache.get(key)
+    if content is None:
+        content = SHOPPING_CART_RENDERERS[file_format](ingredients)
+        cache.set(key, content, settings.SHOPPING_CART_CACHE_TIMEOUT)
+    return content
+
+
+def latest_recipes(author_ids, limit, fields=('id', 'name', 'image',
+                                              'image_thumbnail',
+                                              'cooking_time', 'author_id')):
+    """Последние limit рецептов каждого из авторов (все рецепты,
+    если limit равен None) одним запросом.
+    Рецепты нумеруются оконной функцией внутри каждого автора;
+    если база её не поддерживает, используется коррелированный
+    подзапрос с LIMIT по индексу (author, -pub_date).
+    """
+    recipes = defaultdict(list)
+    if not author_ids or limit == 0:
+        return recipes
+    ordering = ('-pub_date', '-id')
+    queryset = Recipe.objects.filter(author_id__in=author_ids)
+    if limit is not None:
+        if connection.features.supports_over_clause:
+            queryset = filter_latest_by_window(queryset, limit)
+        else:
+            queryset = queryset.filter(id__in=Subquery(
+                Recipe.objects.filter(
+                    author_id=OuterRef('author_id')
+                ).order_by(*ordering).values('id')[:limit]
+            ))
+    for recipe in queryset.order_by(*ordering).only(*fields):
+        recipes[recipe.author_id].append(recipe)
+    return recipes
+
+
+def filter_latest_by_window(queryset, limit):
+    """Отбор последних рецептов каждого автора через ROW_NUMBER().
+    Django не позволяет фильтровать по оконной функции,
+    поэтому нумерация выполняется в подзапросе.
+    """
+    ranked = queryset.annotate(
+        recipe_rank=Window(
+            expression=RowNumber(),
+            partition_by=[F('author_id')],
+            order_by=[F('pub_date').desc(), F('id').desc()],
+        )
+    ).order_by().values('id', 'recipe_rank')
+    sql, params = ranked.query.sql_with_params()
+    quote = connection.ops.quote_name
+    column = f'{quote(Recipe._meta.db_table)}.{quote("id")}'
+    return queryset.extra(
+        where=[
+            f'{column} IN (SELECT ranked.id FROM ({sql}) ranked '
+            f'WHERE ranked.recipe_rank <= %s)'
+        ],
+        params=[*params, limit],
+    )
@@ -0,0 +1,92 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from recipe.models import (FavoriteList, Ingredient, IngredientAmount, Recipe,
+                           ShoppingList, Tag)
+from recipe.search import search_fields_changed
+from users.models import User
+
+from .cache import (INGREDIENTS_VERSION, RECIPES_VERSION, SCORES_VERSION,
+                    SEARCH_VERSION, TAGS_VERSION, bump_version, bump_versions,
+                    recipe_version_name, user_version_name)
+from .pantry import record_changes
+
+AUTHOR_FIELDS = {'email', 'username', 'first_name', 'last_name'}
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredients_changed(sender, **kwargs):
+    bump_version(INGREDIENTS_VERSION)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tags_changed(sender, **kwargs):
+    bump_version(TAGS_VERSION)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_changed(sender, instance, update_fields=None, **kwargs):
+    """Полное сохранение рецепта (в том числе со списком всех полей,
+    кроме счётчиков, см. CounterFieldsMixin) сопровождает изменение
+    ингредиентов через bulk_create, поэтому записывается в журнал
+    продуктов; служебные сохранения отдельных полей — нет.
+    """
+    names = [RECIPES_VERSION, recipe_version_name(instance.pk)]
+    edited = search_fields_changed(update_fields)
+    if edited:
+        names.append(SEARCH_VERSION)
+    bump_versions(names)
+    if edited:
+        record_changes((instance.pk,))
+
+
+@receiver(post_save, sender=IngredientAmount)
+@receiver(post_delete, sender=IngredientAmount)
+def ingredient_amount_changed(sender, instance, **kwargs):
+    bump_versions((
+        RECIPES_VERSION, SEARCH_VERSION,
+        recipe_version_name(instance.recipe_id),
+    ))
+    record_changes((instance.recipe_id,))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set,
+                        **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        recipe_ids = [instance.pk]
+    elif pk_set is not None:
+        recipe_ids = pk_set
+    else:
+        bump_versions((RECIPES_VERSION, TAGS_VERSION))
+        return
+    bump_versions([RECIPES_VERSION] + [
+        recipe_version_name(recipe_id) for recipe_id in recipe_ids
+    ])
+
+
+@receiver(post_save, sender=FavoriteList)
+@receiver(post_delete, sender=FavoriteList)
+@receiver(post_save, sender=ShoppingList)
+@receiver(post_delete, sender=ShoppingList)
+def recipe_scores_changed(sender, **kwargs):
+    """Избранное и списки покупок меняют оценки рецептов,
+    по которым сортируется лента с параметром ordering.
+    """
+    bump_version(SCORES_VERSION)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    """Рецепты в ленте содержат данные автора. Сохранения, которые
+    не меняют эти данные (например, last_login при входе), кэш
+    не сбрасывают.
+    """
+    if update_fields is not None and not AUTHOR_FIELDS & set(update_fields):
+        return
+    bump_versions((RECIPES_VERSION, user_version_name(instance.pk)))
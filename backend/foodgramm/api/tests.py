@@ -0,0 +1,452 @@
+import base64
+import io
+import os
+import re
+import tracemalloc
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from recipe.models import (FavoriteList, Ingredient, IngredientAmount, Recipe,
+                           RecipeScore, ShoppingList, SimilarRecipe, Tag,
+                           TimelineEntry)
+from recipe.search import uses_search_vector
+from recipe.similar import build_similar
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APITestCase
+from users.models import Follow, User
+
+from .search import recipe_search_index
+from .serializers import StreamingBase64ImageField
+
+RECIPES = 30
+UPLOAD_SIZE = 4 * 2 ** 20
+MAX_UPLOAD_PEAK = 2 * 2 ** 20
+LARGE_TABLES = (
+    Recipe._meta.db_table,
+    Recipe.tags.through._meta.db_table,
+    IngredientAmount._meta.db_table,
+    FavoriteList._meta.db_table,
+    ShoppingList._meta.db_table,
+    SimilarRecipe._meta.db_table,
+    RecipeScore._meta.db_table,
+    Follow._meta.db_table,
+    TimelineEntry._meta.db_table,
+)
+# Кэш в памяти процесса, чтобы обращения к DatabaseCache не попадали
+# в число запросов к базе; тест выполняется в одном процессе.
+LOCAL_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'KEY_FUNCTION': 'api.cache.make_key',
+    }
+}
+SEQUENTIAL_SCAN = {
+    'postgresql': r'Seq Scan on (?P<table>\w+)',
+    'sqlite': r'SCAN (?:TABLE )?(?P<table>\w+)\b(?! USING)',
+}
+
+
+def encode(image, image_format, **options):
+    content = io.BytesIO()
+    image.save(content, format=image_format, **options)
+    encoded = base64.b64encode(content.getvalue()).decode()
+    return f'data:image/{image_format.lower()};base64,{encoded}'
+
+
+def create_recipes(author, count):
+    """Рецепты автора с тэгами и ингредиентами: по две записи
+    в каждой связанной таблице на рецепт.
+    """
+    tags = [
+        Tag.objects.create(name=f'Тэг {slug}', color=color, slug=slug)
+        for slug, color in (('breakfast', '#E26C2D'), ('lunch', '#49B64E'))
+    ]
+    ingredients = [
+        Ingredient.objects.create(name=name, measurement_unit='г')
+        for name in ('мука', 'сахар')
+    ]
+    recipes = []
+    for number in range(count):
+        recipe = Recipe.objects.create(
+            author=author, name=f'Рецепт {number}', text='Описание',
+            cooking_time=10,
+        )
+        recipe.tags.set(tags)
+        IngredientAmount.objects.bulk_create(
+            IngredientAmount(recipe=recipe, ingredient=ingredient, amount=100)
+            for ingredient in ingredients
+        )
+        recipes.append(recipe)
+    return recipes
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class RecipeListQueryCountTest(APITestCase):
+    """Число запросов ленты рецептов не зависит от размера страницы.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass'
+        )
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass'
+        )
+        recipes = create_recipes(cls.author, RECIPES)
+        Follow.objects.create(user=cls.user, author=cls.author)
+        FavoriteList.objects.create(user=cls.user, recipe=recipes[0])
+        ShoppingList.objects.create(user=cls.user, recipe=recipes[1])
+
+    def assert_fixed_query_count(self, expected):
+        for limit in (5, 25):
+            with self.subTest(limit=limit):
+                cache.clear()
+                with self.assertNumQueries(expected):
+                    response = self.client.get(f'/api/recipes/?limit={limit}')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.json()['results']), limit)
+
+    def test_anonymous_feed(self):
+        self.assert_fixed_query_count(4)
+
+    def test_authenticated_feed(self):
+        self.client.force_authenticate(self.user)
+        self.assert_fixed_query_count(4)
+
+
+class CounterFieldsTest(APITestCase):
+    """Сохранение устаревшего экземпляра не затирает счётчики,
+    изменённые после его загрузки.
+    """
+    def setUp(self):
+        self.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass'
+        )
+        self.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass'
+        )
+        self.recipe = create_recipes(self.author, 1)[0]
+
+    def test_stale_user_save(self):
+        author = User.objects.get(pk=self.author.pk)
+        Follow.objects.create(user=self.user, author=self.author)
+        author.first_name = 'Автор'
+        author.save()
+        author.refresh_from_db()
+        self.assertEqual(author.first_name, 'Автор')
+        self.assertEqual(author.followers_count, 1)
+        self.assertEqual(author.recipes_count, 1)
+
+    def test_stale_recipe_save(self):
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        FavoriteList.objects.create(user=self.user, recipe=self.recipe)
+        ShoppingList.objects.create(user=self.user, recipe=self.recipe)
+        recipe.name = 'Новое название'
+        recipe.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.name, 'Новое название')
+        self.assertEqual(recipe.favorites_count, 1)
+        self.assertEqual(recipe.in_carts_count, 1)
+
+    def test_profile_and_recipe_edit(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        FavoriteList.objects.create(user=self.user, recipe=self.recipe)
+        self.client.force_authenticate(self.author)
+        response = self.client.patch(
+            '/api/users/me/', {'first_name': 'Автор'}, format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        response = self.client.patch(
+            f'/api/recipes/{self.recipe.id}/',
+            {'name': 'Новое название', 'cooking_time': 15}, format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 1)
+        self.assertEqual(self.author.followers_count, 1)
+
+
+class SimilarRecipesTest(APITestCase):
+    """В небольшом каталоге, где все рецепты состоят из одних и тех же
+    ингредиентов, похожие рецепты всё равно находятся.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass'
+        )
+        cls.recipes = create_recipes(author, RECIPES)
+
+    def assert_similar_found(self):
+        self.assertEqual(build_similar(), RECIPES)
+        recipe = self.recipes[0]
+        response = self.client.get(f'/api/recipes/{recipe.id}/similar/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            len(response.json()), settings.SIMILAR_RECIPES_COUNT
+        )
+
+    def test_small_catalog(self):
+        self.assert_similar_found()
+
+    def test_only_common_ingredients(self):
+        with self.settings(SIMILAR_RECIPES_MIN_COMMON_DF=0):
+            self.assert_similar_found()
+
+
+class ShoppingCartDownloadTest(APITestCase):
+    """Выгрузка списка покупок сводит один ингредиент в разных
+    единицах к общей единице.
+    """
+    def test_units_merged(self):
+        user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass'
+        )
+        recipe = create_recipes(user, 1)[0]
+        IngredientAmount.objects.bulk_create(
+            IngredientAmount(
+                recipe=recipe, amount=amount,
+                ingredient=Ingredient.objects.create(
+                    name=name, measurement_unit=unit
+                ),
+            )
+            for name, unit, amount in (
+                ('молоко', 'мл', 500), ('Молоко', 'л', 1),
+            )
+        )
+        ShoppingList.objects.create(user=user, recipe=recipe)
+        self.client.force_authenticate(user)
+        cache.clear()
+        response = self.client.get('/api/recipes/download_shopping_cart/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.content.decode().splitlines(),
+            ['молоко, 1500 мл', 'мука, 100 г', 'сахар, 100 г'],
+        )
+
+
+@override_settings(FEED_TIMELINE_MIN_FOLLOWS=1, FEED_TIMELINE_LENGTH=3)
+class TimelineTrimTest(APITestCase):
+    """Публикация рецепта только добавляет записи в ленты подписчиков,
+    лишние записи удаляет build_timelines --trim.
+    """
+    def test_trim_deferred(self):
+        author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass'
+        )
+        user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass'
+        )
+        Follow.objects.create(user=user, author=author)
+        recipes = create_recipes(author, 5)
+        entries = TimelineEntry.objects.filter(user=user)
+        self.assertEqual(entries.count(), 5)
+        call_command('build_timelines', trim=True, stdout=io.StringIO())
+        self.assertEqual(
+            set(entries.values_list('recipe_id', flat=True)),
+            {recipe.id for recipe in recipes[2:]},
+        )
+
+
+class SubscriptionRecipesTest(APITestCase):
+    """Без recipes_limit в подписках выводятся все рецепты автора.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass'
+        )
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass'
+        )
+        create_recipes(cls.author, RECIPES)
+        Follow.objects.create(user=cls.user, author=cls.author)
+
+    def recipes(self, query=''):
+        self.client.force_authenticate(self.user)
+        response = self.client.get(f'/api/users/subscriptions/{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results'][0]['recipes']
+
+    def test_all_recipes_without_limit(self):
+        self.assertEqual(len(self.recipes()), RECIPES)
+
+    def test_limit(self):
+        recipes = self.recipes('?recipes_limit=3')
+        self.assertEqual(
+            [recipe['name'] for recipe in recipes],
+            [f'Рецепт {number}' for number in (29, 28, 27)],
+        )
+
+
+class RecipeWithoutAuthorTest(APITestCase):
+    """Рецепт, у которого не осталось автора, выводится с author: null.
+    """
+    def test_recipe_without_author(self):
+        recipe = create_recipes(None, 1)[0]
+        user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass'
+        )
+        self.client.force_authenticate(user)
+        for url in ('/api/recipes/', f'/api/recipes/{recipe.id}/'):
+            with self.subTest(url=url):
+                cache.clear()
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                data = response.json()
+                card = data['results'][0] if 'results' in data else data
+                self.assertIsNone(card['author'])
+
+
+@override_settings(INGREDIENT_SEARCH_LIMIT=5)
+class IngredientSearchTest(APITestCase):
+    """Поиск ингредиентов по названию возвращает не больше
+    INGREDIENT_SEARCH_LIMIT записей, сначала совпадения по префиксу.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г')
+            for name in [f'мука {number}' for number in range(10)]
+            + ['рисовая мука', 'сахар']
+        )
+
+    def search(self, name):
+        cache.clear()
+        response = self.client.get('/api/ingredients/', {'name': name})
+        self.assertEqual(response.status_code, 200)
+        return [item['name'] for item in response.json()]
+
+    def test_limit(self):
+        self.assertEqual(
+            self.search('м'), [f'мука {number}' for number in range(5)]
+        )
+
+    def test_substring_after_prefix(self):
+        with self.settings(INGREDIENT_SEARCH_LIMIT=20):
+            names = self.search('мук')
+        self.assertEqual(len(names), 11)
+        self.assertEqual(names[-1], 'рисовая мука')
+
+
+class QueryPlanTest(APITestCase):
+    """Запросы основных эндпоинтов не просматривают большие таблицы
+    целиком. В PostgreSQL полный просмотр запрещается на время EXPLAIN,
+    поэтому на маленькой тестовой базе план показывает, есть ли
+    подходящий индекс.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass'
+        )
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass'
+        )
+        recipes = create_recipes(cls.author, RECIPES)
+        cls.recipe = recipes[0]
+        Follow.objects.create(user=cls.user, author=cls.author)
+        FavoriteList.objects.create(user=cls.user, recipe=recipes[0])
+        ShoppingList.objects.create(user=cls.user, recipe=recipes[1])
+
+    def setUp(self):
+        if connection.vendor not in SEQUENTIAL_SCAN:
+            self.skipTest(f'База данных {connection.vendor} не поддерживается')
+        cache.clear()
+        self.client.force_authenticate(self.user)
+        if not uses_search_vector():
+            # Индекс поиска в памяти строится чтением таблиц целиком.
+            recipe_search_index.search('рецепт', 1)
+
+    def endpoints(self):
+        tags = 'tags=breakfast&tags=lunch'
+        return (
+            ('similar', f'/api/recipes/{self.recipe.id}/similar/'),
+            ('feed', '/api/recipes/'),
+            ('feed_cursor', '/api/recipes/?cursor='),
+            ('feed_tags', f'/api/recipes/?{tags}'),
+            ('feed_author', f'/api/recipes/?author={self.author.id}'),
+            ('search', '/api/recipes/?search=рецепт'),
+            ('popular', '/api/recipes/?ordering=popular'),
+            ('trending', f'/api/recipes/?ordering=trending&{tags}'),
+            ('favorites', '/api/recipes/?is_favorited=1'),
+            ('shopping_cart', '/api/recipes/?is_in_shopping_cart=1'),
+            ('subscriptions', '/api/users/subscriptions/?recipes_limit=3'),
+            ('following_feed', '/api/recipes/feed/'),
+            ('download_shopping_cart',
+             '/api/recipes/download_shopping_cart/'),
+            ('shopping_cart_summary', '/api/recipes/shopping_cart_summary/'),
+        )
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SET enable_seqscan = off')
+                cursor.execute(f'EXPLAIN {sql}')
+                return '\n'.join(row[0] for row in cursor.fetchall())
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return '\n'.join(row[-1] for row in cursor.fetchall())
+
+    def sequential_scans(self, sql):
+        plan = self.explain(sql)
+        pattern = SEQUENTIAL_SCAN[connection.vendor]
+        return [
+            match.group('table') for match in re.finditer(pattern, plan)
+            if match.group('table') in LARGE_TABLES
+        ]
+
+    def test_no_sequential_scans(self):
+        for name, url in self.endpoints():
+            with self.subTest(endpoint=name):
+                with CaptureQueriesContext(connection) as captured:
+                    response = self.client.get(url)
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                self.assertEqual(response.status_code, 200)
+                for query in captured.captured_queries:
+                    sql = query['sql']
+                    if not sql.lstrip().upper().startswith('SELECT'):
+                        continue
+                    self.assertEqual(self.sequential_scans(sql), [], sql)
+
+
+class UploadMemoryTest(SimpleTestCase):
+    """Пиковая память декодирования изображения не зависит от размера
+    загрузки, а «бомба» отклоняется по заголовку.
+    """
+    def measure(self, data):
+        """Пиковая память декодирования без учёта самой строки base64:
+        её размер определяется телом запроса.
+        """
+        field = StreamingBase64ImageField()
+        error = None
+        tracemalloc.start()
+        try:
+            field.to_internal_value(data).close()
+        except ValidationError as exception:
+            error = exception.get_codes()[0]
+        finally:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        return peak, error
+
+    def test_large_upload(self):
+        side = int((UPLOAD_SIZE / 3) ** 0.5)
+        data = encode(Image.frombytes(
+            'RGB', (side, side), os.urandom(side * side * 3)
+        ), 'PNG', compress_level=0)
+        peak, error = self.measure(data)
+        self.assertIsNone(error)
+        self.assertLess(peak, MAX_UPLOAD_PEAK)
+
+    def test_decompression_bomb(self):
+        data = encode(Image.new('L', (10000, 10000)), 'PNG')
+        peak, error = self.measure(data)
+        self.assertEqual(error, 'too_many_pixels')
+        self.assertLess(peak, MAX_UPLOAD_PEAK)
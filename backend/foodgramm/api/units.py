@@ -0,0 +1,127 @@
+import re
+import threading
+from collections import defaultdict
+
+from recipe.models import Ingredient
+
+from .cache import INGREDIENTS_VERSION, get_version
+
+UNIT_SEPARATORS = re.compile(r'[\s.]+')
+# Единица измерения → (базовая единица, множитель). Ключи записаны
+# в нижнем регистре без точек и пробелов, как их возвращает unit_key.
+UNIT_CONVERSIONS = {
+    'мг': ('г', 0.001),
+    'г': ('г', 1),
+    'гр': ('г', 1),
+    'грамм': ('г', 1),
+    'кг': ('г', 1000),
+    'мл': ('мл', 1),
+    'л': ('мл', 1000),
+    'чл': ('мл', 5),
+    'стл': ('мл', 15),
+    'стакан': ('мл', 200),
+}
+
+
+def unit_key(unit):
+    return UNIT_SEPARATORS.sub('', unit.lower().replace('ё', 'е'))
+
+
+def name_key(name):
+    return ' '.join(name.lower().replace('ё', 'е').split())
+
+
+def format_amount(amount):
+    amount = round(amount, 3)
+    return int(amount) if amount == int(amount) else amount
+
+
+class IngredientUnits:
+    """Таблица приведения ингредиентов в памяти процесса:
+    ингредиент → (каноническое название, единица, множитель).
+    Ингредиенты с одинаковым названием и единицами одной величины
+    («молоко, мл» и «молоко, л») сводятся к базовой единице,
+    разные написания одной единицы («шт.» и «шт») — к первому из них.
+    Таблица перестраивается, когда меняется версия справочника
+    ингредиентов или встречается ингредиент, которого в ней нет
+    (например, созданный до записи новой версии справочника в кэш).
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._units = {}
+
+    def _build(self, version):
+        groups = defaultdict(list)
+        for ingredient_id, name, unit in Ingredient.objects.order_by(
+            'id'
+        ).values_list('id', 'name', 'measurement_unit'):
+            key = unit_key(unit)
+            base, factor = UNIT_CONVERSIONS.get(key, (unit, 1))
+            quantity = base if key in UNIT_CONVERSIONS else key
+            groups[name_key(name), quantity].append(
+                (ingredient_id, name, unit, key, base, factor)
+            )
+        units = {}
+        for members in groups.values():
+            _, name, unit, key, base, _ = members[0]
+            convert = any(member[3] != key for member in members)
+            for ingredient_id, _, _, _, _, factor in members:
+                units[ingredient_id] = (
+                    (name, base, factor) if convert else (name, unit, 1)
+                )
+        self._units = units
+        self._version = version
+
+    def _ensure_fresh(self):
+        version = get_version(INGREDIENTS_VERSION)
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._build(version)
+
+    def _lookup(self, ingredient_ids):
+        units = self._units
+        missing = set(ingredient_ids).difference(units)
+        if not missing:
+            return units
+        with self._lock:
+            if missing.difference(self._units):
+                self._build(self._version)
+            units = self._units
+        missing.difference_update(units)
+        if missing:
+            # Ингредиенты, созданные после перестроения таблицы,
+            # выводятся без приведения единиц.
+            units = dict(units)
+            for ingredient_id, name, unit in Ingredient.objects.filter(
+                id__in=missing
+            ).values_list('id', 'name', 'measurement_unit'):
+                units[ingredient_id] = (name, unit, 1)
+        return units
+
+    def convert(self, totals):
+        """Строки (название, количество, единица), отсортированные
+        по названию, из пар (ингредиент, количество) за один проход.
+        Пары читаются целиком: в одну строку сводятся ингредиенты,
+        названия которых различаются регистром, «ё» или пробелами,
+        и порядок сортировки в базе не ставит их рядом.
+        """
+        self._ensure_fresh()
+        totals = list(totals)
+        units = self._lookup(
+            ingredient_id for ingredient_id, _ in totals
+        )
+        amounts = defaultdict(int)
+        for ingredient_id, total in totals:
+            if ingredient_id not in units:
+                continue
+            name, unit, factor = units[ingredient_id]
+            amounts[name, unit] += total * factor
+        return [
+            (name, format_amount(amount), unit)
+            for (name, unit), amount in sorted(amounts.items())
+        ]
+
+
+ingredient_units = IngredientUnits()
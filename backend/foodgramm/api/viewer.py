@@ -0,0 +1,56 @@
+from django.utils.functional import cached_property
+from recipe.models import FavoriteList, ShoppingList
+from users.models import Follow
+
+
+class ViewerContext:
+    """Избранное, список покупок и подписки текущего пользователя.
+    Каждое множество идентификаторов загружается одним запросом
+    при первом обращении и живёт до конца запроса.
+    """
+    def __init__(self, user):
+        self.user = user
+
+    @property
+    def is_anonymous(self):
+        return self.user is None or self.user.is_anonymous
+
+    def _ids(self, queryset, field):
+        if self.is_anonymous:
+            return frozenset()
+        return frozenset(
+            queryset.filter(user=self.user).values_list(field, flat=True)
+        )
+
+    @cached_property
+    def favorite_ids(self):
+        return self._ids(FavoriteList.objects, 'recipe_id')
+
+    @cached_property
+    def cart_ids(self):
+        return self._ids(ShoppingList.objects, 'recipe_id')
+
+    @cached_property
+    def following_ids(self):
+        return self._ids(Follow.objects, 'author_id')
+
+    def is_favorited(self, recipe_id):
+        return recipe_id in self.favorite_ids
+
+    def is_in_shopping_cart(self, recipe_id):
+        return recipe_id in self.cart_ids
+
+    def is_subscribed(self, author_id):
+        return author_id in self.following_ids
+
+
+def get_viewer(request):
+    """Контекст пользователя, закреплённый за запросом.
+    """
+    if request is None:
+        return ViewerContext(None)
+    viewer = getattr(request, '_viewer', None)
+    if viewer is None or viewer.user != request.user:
+        viewer = ViewerContext(request.user)
+        request._viewer = viewer
+    return viewer
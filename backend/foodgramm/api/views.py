@@ -1,22 +1,35 @@
-from api.pagination import CustomPagination
-from django.db.models import Sum
+from api.pagination import (CustomPagination, ListPagination, RecipePagination,
+                            SubscriptionPagination)
+from django.conf import settings
+from django.db.models import BooleanField, Exists, OuterRef, Value
 from django.http.response import HttpResponse
 from djoser.views import UserViewSet
-from recipe.models import (FavoriteList, Ingredient, IngredientAmount, Recipe,
-                           ShoppingList, Tag)
+from recipe.models import FavoriteList, Ingredient, Recipe, ShoppingList, Tag
+from recipe.timeline import feed_filter
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.generics import get_object_or_404
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from users.models import Follow, User
 
-from .filters import RecipeFilter
+from .autocomplete import ingredient_index
+from .cache import (INGREDIENTS_VERSION, RECIPES_VERSION, SCORES_VERSION,
+                    TAGS_VERSION)
+from .filters import IngredientFilter, RecipeFilter
+from .mixins import AnonymousFeedCacheMixin, CachedReadMixin
+from .pantry import pantry_index
 from .permissions import IsOwnerOrAdminOrReadOnly
+from .renderers import CSVRenderer, PDFRenderer, PlainTextRenderer
 from .serializers import (CreateUpdateRecipeSerializer, FavoriteListSerializer,
                           IngredientSerializer, RecipeListSerializer,
                           ShoppingListSerializer, TagSerializer,
-                          UserFollowSerializer, UserSerializer)
+                          UserFollowSerializer, UserSerializer,
+                          get_recipes_limit)
+from .services import (SHOPPING_CART_CONTENT_TYPES, SHOPPING_CART_FILENAME,
+                       get_shopping_cart_ingredients, latest_recipes,
+                       render_shopping_cart)
 
 
 class UserViewSet(UserViewSet):
@@ -64,13 +77,22 @@ class UserViewSet(UserViewSet):
 
     @action(
         detail=False,
-        permission_classes=[IsAuthenticated]
+        permission_classes=[IsAuthenticated],
+        pagination_class=SubscriptionPagination,
     )
     def subscriptions(self, request):
         """Список подписок пользователя
         """
-        queryset = Follow.objects.filter(user=self.request.user)
+        limit = get_recipes_limit(request)
+        queryset = Follow.objects.filter(
+            user=self.request.user
+        ).select_related('author')
         pages = self.paginate_queryset(queryset)
+        recipes = latest_recipes(
+            [follow.author_id for follow in pages], limit
+        )
+        for follow in pages:
+            follow.author.latest_recipes = recipes[follow.author_id]
         serializer = UserFollowSerializer(
             pages,
             many=True,
@@ -79,32 +101,86 @@ class UserViewSet(UserViewSet):
         return self.get_paginated_response(serializer.data)
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(CachedReadMixin, viewsets.ReadOnlyModelViewSet):
     """Работа с тэгами
     """
+    cache_version_names = (TAGS_VERSION,)
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
     permission_classes = (AllowAny,)
 
 
-class IngredientsViewSet(viewsets.ModelViewSet):
+class IngredientsViewSet(CachedReadMixin, viewsets.ModelViewSet):
     """Работа с ингредиантами
     """
+    cache_version_names = (INGREDIENTS_VERSION,)
     serializer_class = IngredientSerializer
     queryset = Ingredient.objects.all()
     pagination_class = None
     permission_classes = (AllowAny,)
+    filter_class = IngredientFilter
+
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name and settings.INGREDIENT_SEARCH_IN_MEMORY:
+            return Response(ingredient_index.search(name))
+        return super().list(request, *args, **kwargs)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(AnonymousFeedCacheMixin, viewsets.ModelViewSet):
     """Работа с рецептами
     """
+    cache_version_names = (RECIPES_VERSION, TAGS_VERSION, INGREDIENTS_VERSION)
+    cache_query_params = (
+        'page', 'limit', 'cursor', 'tags', 'author',
+        'is_favorited', 'is_in_shopping_cart', 'search', 'ordering',
+    )
     queryset = Recipe.objects.all()
-    pagination_class = CustomPagination
+    lookup_value_regex = r'\d+'
+    pagination_class = RecipePagination
     permission_classes = (IsOwnerOrAdminOrReadOnly,)
     filter_class = RecipeFilter
 
+    def get_cache_version_names(self, request):
+        """Порядок ленты с параметром ordering зависит от оценок,
+        которые меняются с каждым добавлением в избранное.
+        """
+        names = super().get_cache_version_names(request)
+        if 'ordering' in request.query_params:
+            return names + (SCORES_VERSION,)
+        return names
+
+    def get_queryset(self):
+        """Рецепты с флагами избранного, списка покупок и подписки
+        на автора, вычисленными подзапросами.
+        Теги и ингредиенты загружаются сериализатором только для карточек,
+        которых нет в кэше, поэтому число запросов не зависит
+        от размера страницы.
+        """
+        user = self.request.user
+        queryset = Recipe.objects.select_related('author').defer(
+            'search_vector'
+        )
+        if user.is_anonymous:
+            false = Value(False, output_field=BooleanField())
+            return queryset.annotate(
+                favorited=false,
+                in_shopping_cart=false,
+                author_subscribed=false,
+            )
+        return queryset.annotate(
+            favorited=Exists(FavoriteList.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            in_shopping_cart=Exists(ShoppingList.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            author_subscribed=Exists(Follow.objects.filter(
+                user=user, author=OuterRef('author')
+            )),
+        )
+
     def get_serializer_class(self):
         if self.request.method in ('POST', 'PUT', 'PATCH'):
             return CreateUpdateRecipeSerializer
@@ -172,24 +248,108 @@ class RecipeViewSet(viewsets.ModelViewSet):
             request, ShoppingList, pk
         )
 
+    @action(detail=False, permission_classes=[IsAuthenticated])
+    def feed(self, request):
+        """Лента рецептов авторов, на которых подписан пользователь
+        """
+        queryset = self.filter_queryset(self.get_queryset()).filter(
+            feed_filter(request.user)
+        ).order_by('-pub_date', '-id')
+        page = self.paginate_queryset(queryset)
+        serializer = RecipeListSerializer(
+            page, many=True, context=self.get_serializer_context()
+        )
+        return self.get_paginated_response(serializer.data)
+
+    def get_pantry_ingredients(self, request):
+        try:
+            ingredient_ids = {
+                int(value)
+                for value in request.query_params.getlist('ingredients')
+            }
+        except ValueError:
+            raise ValidationError(
+                {'ingredients': 'Ингредиенты задаются их id.'}
+            )
+        if not ingredient_ids:
+            raise ValidationError({'ingredients': 'Укажите ингредиенты.'})
+        if len(ingredient_ids) > settings.PANTRY_MAX_INGREDIENTS:
+            raise ValidationError({'ingredients': (
+                f'Не больше {settings.PANTRY_MAX_INGREDIENTS} ингредиентов.'
+            )})
+        return ingredient_ids
+
+    @action(detail=False, pagination_class=ListPagination)
+    def pantry(self, request):
+        """Рецепты из имеющихся ингредиентов: сначала те, для которых
+        есть наибольшая доля ингредиентов. Совпадения считаются
+        по индексу в памяти, из базы загружается только страница.
+        """
+        matches = pantry_index.match(
+            self.get_pantry_ingredients(request),
+            settings.PANTRY_RESULTS_LIMIT
+        )
+        page = self.paginate_queryset(matches)
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _, _ in page]
+        )
+        page = [match for match in page if match[0] in recipes]
+        serializer = RecipeListSerializer(
+            [recipes[recipe_id] for recipe_id, _, _ in page],
+            many=True, context=self.get_serializer_context()
+        )
+        for data, (_, matched, total) in zip(serializer.data, page):
+            data['matched_ingredients'] = matched
+            data['missing_ingredients'] = total - matched
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=True, pagination_class=None)
+    def similar(self, request, pk=None):
+        """Похожие рецепты из таблицы, рассчитанной командой
+        build_similar_recipes: выборка по индексу (recipe, -score).
+        """
+        recipes = list(self.get_queryset().filter(
+            similar_to__recipe_id=pk
+        ).order_by('-similar_to__score')[:settings.SIMILAR_RECIPES_COUNT])
+        if not recipes:
+            get_object_or_404(Recipe, pk=pk)
+        serializer = RecipeListSerializer(
+            recipes, many=True, context=self.get_serializer_context()
+        )
+        return Response(serializer.data)
+
     @action(
         detail=False,
         methods=['get'],
-        permission_classes=[IsAuthenticated]
+        permission_classes=[IsAuthenticated],
+        renderer_classes=[PlainTextRenderer, CSVRenderer, PDFRenderer],
     )
     def download_shopping_cart(self, request):
-        queryset = self.get_queryset()
-        cart_objects = ShoppingList.objects.filter(user=request.user)
-        recipe = queryset.filter(recipe_in_shoplist__in=cart_objects)
-        ingredients = IngredientAmount.objects.filter(recipe__in=recipe)
-        ing_types = Ingredient.objects.filter(
-            ingredient_amount__in=ingredients
-        ).annotate(total=Sum('ingredient_amount__amount'))
-
-        lines = [f'{ing_type.name}, {ing_type.total}'
-                 f' {ing_type.measurement_unit}' for ing_type in ing_types]
-        filename = 'shopping_card.txt'
-        response_content = '\n'.join(lines)
-        response = HttpResponse(response_content, content_type='text/plain')
-        response['Content-Disposition'] = f'attachment; filename={filename}'
+        file_format = request.accepted_renderer.format
+        response = HttpResponse(
+            render_shopping_cart(
+                get_shopping_cart_ingredients(request.user), file_format
+            ),
+            content_type=SHOPPING_CART_CONTENT_TYPES[file_format]
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename={SHOPPING_CART_FILENAME}.{file_format}'
+        )
         return response
+
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=[IsAuthenticated],
+        pagination_class=None,
+    )
+    def shopping_cart_summary(self, request):
+        """Список покупок в JSON с количествами в общих единицах,
+        те же строки, что и в download_shopping_cart.
+        """
+        return Response([
+            {'name': name, 'amount': amount, 'measurement_unit': unit}
+            for name, amount, unit in get_shopping_cart_ingredients(
+                request.user
+            )
+        ])
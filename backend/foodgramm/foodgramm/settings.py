@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 import os
+from datetime import datetime, timezone
 from pathlib import Path
 
 from dotenv import main
@@ -54,6 +55,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.QueryProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -98,6 +100,20 @@ DATABASES = {
     }
 }
 
+# Версии данных и журнал изменений в кэше должны быть видны всем
+# процессам, поэтому кэш общий; кэш в памяти процесса запрещён
+# проверкой api.E001.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.memcached.MemcachedCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='cache:11211'),
+        'KEY_FUNCTION': 'api.cache.make_key',
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -180,3 +196,69 @@ DJOSER = {
 }
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+SHOPPING_CART_FONT = os.getenv(
+    'SHOPPING_CART_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+SHOPPING_CART_CACHE_TIMEOUT = 60 * 60
+
+INGREDIENT_SEARCH_IN_MEMORY = True
+INGREDIENT_SEARCH_LIMIT = 50
+REFERENCE_CACHE_TIMEOUT = 60 * 60 * 24
+PAGINATION_COUNT_CACHE_TIMEOUT = 60
+RECIPE_FEED_CACHE_TIMEOUT = 60 * 10
+RECIPE_CARD_CACHE_TIMEOUT = 60 * 60 * 24
+FEED_TIMELINE_MIN_FOLLOWS = 100
+FEED_TIMELINE_LENGTH = 1000
+FEED_TIMELINE_BATCH_SIZE = 1000
+RECIPE_SEARCH_CONFIG = 'russian'
+RECIPE_SEARCH_FALLBACK_LIMIT = 1000
+PANTRY_MAX_INGREDIENTS = 50
+PANTRY_RESULTS_LIMIT = 1000
+PANTRY_CHANGES_TIMEOUT = 60 * 60 * 24
+PANTRY_MAX_PENDING_CHANGES = 1000
+SIMILAR_RECIPES_COUNT = 10
+SIMILAR_RECIPES_TAG_WEIGHT = 1.0
+SIMILAR_RECIPES_MAX_DF = 0.05
+SIMILAR_RECIPES_MIN_COMMON_DF = 100
+SIMILAR_RECIPES_BATCH_SIZE = 500
+RECIPE_SCORE_EPOCH = datetime(2023, 1, 1, tzinfo=timezone.utc)
+RECIPE_SCORE_HALF_LIFE = {
+    'popular': 60 * 60 * 24 * 30,
+    'trending': 60 * 60 * 24 * 2,
+}
+RECIPE_SCORE_FAVORITE_WEIGHT = 1.0
+RECIPE_SCORE_CART_WEIGHT = 0.5
+RECIPE_SCORE_BATCH_SIZE = 1000
+
+RECIPE_IMAGE_WORKERS = int(os.getenv('RECIPE_IMAGE_WORKERS', default=2))
+RECIPE_IMAGE_FORMAT = 'WEBP'
+RECIPE_IMAGE_QUALITY = 80
+RECIPE_IMAGE_THUMBNAIL_SIZE = 320
+RECIPE_IMAGE_MEDIUM_SIZE = 960
+RECIPE_IMAGE_MAX_ATTEMPTS = 3
+RECIPE_IMAGE_TASK_TIMEOUT = 60 * 5
+RECIPE_IMAGE_MAX_UPLOAD_SIZE = 10 * 2 ** 20
+RECIPE_IMAGE_MAX_PIXELS = 40 * 10 ** 6
+RECIPE_IMAGE_DECODE_CHUNK_SIZE = 64 * 1024
+
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', default=0))
+PROFILING_RESPONSE_HEADER = (
+    os.getenv('PROFILING_RESPONSE_HEADER', default='False') == 'True'
+)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api.profiling': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
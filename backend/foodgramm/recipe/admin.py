@@ -1,4 +1,5 @@
 from django.contrib import admin
+from recipe import images
 from recipe.models import (FavoriteList, Ingredient, IngredientAmount, Recipe,
                            ShoppingList, Tag)
 from users.models import Follow
@@ -21,12 +22,19 @@ class TagAdmin(admin.ModelAdmin):
 class RecipeAdmin(admin.ModelAdmin):
     list_display = ('author', 'name', 'count_favorites')
     list_filter = ('author', 'name', 'tags')
+    list_select_related = ('author',)
     inlines = (RecipeIngredientInline,)
 
     def count_favorites(self, obj):
-        return FavoriteList.objects.filter(recipe=obj).count()
+        return obj.favorites_count
 
     count_favorites.short_description = 'В избранном'
+    count_favorites.admin_order_field = 'favorites_count'
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if 'image' in form.changed_data:
+            images.enqueue(obj)
 
 
 class ShoppingListAdmin(admin.ModelAdmin):
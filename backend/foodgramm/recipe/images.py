@@ -0,0 +1,166 @@
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .models import Recipe, RecipeImageTask
+
+logger = logging.getLogger(__name__)
+
+VARIANT_FIELDS = ('image_thumbnail', 'image_medium')
+EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg'}
+
+_executor_lock = threading.Lock()
+
+
+def variant_sizes():
+    return {
+        'image_thumbnail': settings.RECIPE_IMAGE_THUMBNAIL_SIZE,
+        'image_medium': settings.RECIPE_IMAGE_MEDIUM_SIZE,
+    }
+
+
+@lru_cache(maxsize=None)
+def _create_executor():
+    return ThreadPoolExecutor(
+        max_workers=settings.RECIPE_IMAGE_WORKERS,
+        thread_name_prefix='recipe-images',
+    )
+
+
+def get_executor():
+    """Пул потоков процесса; создаётся один раз при первом обращении.
+    """
+    with _executor_lock:
+        return _create_executor()
+
+
+def enqueue(recipe):
+    """Постановка изображения рецепта в очередь обработки.
+    Старые копии удаляются, до готовности новых отдаётся оригинал.
+    """
+    old_files = [
+        getattr(recipe, field) for field in VARIANT_FIELDS
+        if getattr(recipe, field)
+    ]
+    for field in VARIANT_FIELDS:
+        setattr(recipe, field, '')
+    Recipe.objects.filter(pk=recipe.pk).update(
+        **{field: '' for field in VARIANT_FIELDS}
+    )
+    if not recipe.image:
+        RecipeImageTask.objects.filter(recipe=recipe).delete()
+        return
+    RecipeImageTask.objects.update_or_create(
+        recipe=recipe,
+        defaults={'attempts': 0, 'started_at': None, 'error': ''},
+    )
+
+    def on_commit():
+        for file in old_files:
+            file.storage.delete(file.name)
+        if settings.RECIPE_IMAGE_WORKERS:
+            get_executor().submit(run_task, recipe.pk)
+
+    transaction.on_commit(on_commit)
+
+
+def pending_tasks():
+    """Задания, которые можно взять в обработку.
+    """
+    stale = timezone.now() - timedelta(
+        seconds=settings.RECIPE_IMAGE_TASK_TIMEOUT
+    )
+    return RecipeImageTask.objects.filter(
+        Q(started_at__isnull=True) | Q(started_at__lt=stale),
+        attempts__lt=settings.RECIPE_IMAGE_MAX_ATTEMPTS,
+    )
+
+
+def claim(recipe_id):
+    """Атомарная отметка задания как взятого: параллельный обработчик
+    того же задания получит False.
+    """
+    return bool(pending_tasks().filter(recipe_id=recipe_id).update(
+        started_at=timezone.now(), attempts=F('attempts') + 1
+    ))
+
+
+def render_variant(image, size):
+    """Уменьшенная копия без метаданных: сохраняются только пиксели.
+    """
+    variant = image.copy()
+    variant.thumbnail((size, size), Image.LANCZOS)
+    if variant.mode not in ('RGB', 'RGBA') or (
+        variant.mode == 'RGBA' and settings.RECIPE_IMAGE_FORMAT == 'JPEG'
+    ):
+        variant = variant.convert('RGB')
+    content = io.BytesIO()
+    variant.save(
+        content,
+        format=settings.RECIPE_IMAGE_FORMAT,
+        quality=settings.RECIPE_IMAGE_QUALITY,
+    )
+    return content.getvalue()
+
+
+def process(recipe_id):
+    recipe = Recipe.objects.filter(pk=recipe_id).first()
+    if recipe is None or not recipe.image:
+        RecipeImageTask.objects.filter(recipe_id=recipe_id).delete()
+        return
+    source = recipe.image.name
+    with recipe.image.open('rb') as file:
+        image = ImageOps.exif_transpose(Image.open(file))
+        image.load()
+    stem = os.path.splitext(os.path.basename(source))[0]
+    extension = EXTENSIONS[settings.RECIPE_IMAGE_FORMAT]
+    saved = {}
+    for field, size in variant_sizes().items():
+        variant = getattr(recipe, field)
+        variant.save(
+            f'{stem}_{size}.{extension}',
+            ContentFile(render_variant(image, size)),
+            save=False,
+        )
+        saved[field] = variant.name
+    with transaction.atomic():
+        current = Recipe.objects.select_for_update().filter(
+            pk=recipe_id
+        ).first()
+        if current is None or current.image.name != source:
+            for name in saved.values():
+                recipe.image.storage.delete(name)
+            return
+        for field, name in saved.items():
+            setattr(current, field, name)
+        current.save(update_fields=list(saved))
+        RecipeImageTask.objects.filter(recipe_id=recipe_id).delete()
+
+
+def run_task(recipe_id):
+    """Обработка одного задания; ошибка сохраняется в задании,
+    повтор выполнит команда process_images.
+    """
+    try:
+        if not claim(recipe_id):
+            return
+        try:
+            process(recipe_id)
+        except Exception as error:
+            logger.exception('Ошибка обработки изображения %s', recipe_id)
+            RecipeImageTask.objects.filter(recipe_id=recipe_id).update(
+                started_at=None, error=str(error)
+            )
+    finally:
+        connection.close()
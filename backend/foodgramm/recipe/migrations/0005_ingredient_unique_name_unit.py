@@ -0,0 +1,69 @@
+# Generated by Django 2.2.19 on 2026-10-18 02:35
+
+import django.core.validators
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    Ingredient = apps.get_model('recipe', 'Ingredient')
+    IngredientAmount = apps.get_model('recipe', 'IngredientAmount')
+    duplicates = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(keep_id=Min('id'), total=Count('id')).filter(total__gt=1)
+    for duplicate in duplicates:
+        keep_id = duplicate['keep_id']
+        extra_ids = list(Ingredient.objects.filter(
+            name=duplicate['name'],
+            measurement_unit=duplicate['measurement_unit'],
+        ).exclude(id=keep_id).values_list('id', flat=True))
+        # В каждом рецепте остаётся одна строка ингредиента: уже
+        # ссылающаяся на keep_id или первая из строк дубликатов.
+        recipe_ids = set(IngredientAmount.objects.filter(
+            ingredient_id=keep_id
+        ).values_list('recipe_id', flat=True))
+        moved, stale = [], []
+        for amount_id, recipe_id in IngredientAmount.objects.filter(
+            ingredient_id__in=extra_ids
+        ).order_by('id').values_list('id', 'recipe_id'):
+            if recipe_id in recipe_ids:
+                stale.append(amount_id)
+            else:
+                recipe_ids.add(recipe_id)
+                moved.append(amount_id)
+        IngredientAmount.objects.filter(id__in=stale).delete()
+        IngredientAmount.objects.filter(id__in=moved).update(
+            ingredient_id=keep_id
+        )
+        Ingredient.objects.filter(id__in=extra_ids).delete()
+    if schema_editor.connection.vendor == 'postgresql':
+        # Внешние ключи проверяются отложенно, и с ожидающими проверками
+        # PostgreSQL не даст изменить recipe_ingredient в этой транзакции.
+        schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE;')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0004_ingredient_name_trgm_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ingredientamount',
+            name='amount',
+            field=models.PositiveSmallIntegerField(validators=[django.core.validators.MinValueValidator(limit_value=1, message='Минимально количество ингредиентов - 1.'), django.core.validators.MaxValueValidator(limit_value=256, message='Максимальное количество - 256.')], verbose_name='Количество ингредиента'),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='cooking_time',
+            field=models.PositiveIntegerField(validators=[django.core.validators.MinValueValidator(limit_value=1, message='Минимальное время приготовления - 1 минута'), django.core.validators.MaxValueValidator(limit_value=1000, message='Максимальное время приготовления - 1000 минут')], verbose_name='Время приготовления блюда в минутах'),
+        ),
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient_name_unit'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 2.2.19 on 2026-10-18 02:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0006_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-pub_date', '-id'], name='recipe_pub_date_id_idx'),
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX recipe_recipe_tags_tag_recipe_idx '
+            'ON recipe_recipe_tags (tag_id, recipe_id);',
+            'DROP INDEX recipe_recipe_tags_tag_recipe_idx;',
+        ),
+    ]
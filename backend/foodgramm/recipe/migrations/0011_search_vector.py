@@ -0,0 +1,52 @@
+# Generated by Django 2.2.19 on 2026-10-18 03:03
+
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations
+
+CREATE_INDEX = (
+    'CREATE INDEX IF NOT EXISTS recipe_search_vector_gin '
+    'ON recipe_recipe USING gin (search_vector);'
+)
+DROP_INDEX = 'DROP INDEX IF EXISTS recipe_search_vector_gin;'
+FILL_VECTORS = """
+UPDATE recipe_recipe SET search_vector =
+    setweight(to_tsvector(%(config)s, COALESCE(name, '')), 'A')
+    || setweight(to_tsvector(%(config)s, COALESCE(text, '')), 'B')
+    || setweight(to_tsvector(%(config)s, COALESCE((
+        SELECT string_agg(ingredient.name, ' ')
+        FROM recipe_ingredientamount amount
+        JOIN recipe_ingredient ingredient
+            ON ingredient.id = amount.ingredient_id
+        WHERE amount.recipe_id = recipe_recipe.id
+    ), '')), 'C');
+"""
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            FILL_VECTORS, {'config': settings.RECIPE_SEARCH_CONFIG}
+        )
+        schema_editor.execute(CREATE_INDEX)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0010_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 2.2.19 on 2026-10-18 04:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+CREATE_SCORES = (
+    'INSERT INTO recipe_recipescore (recipe_id, popular, trending) '
+    'SELECT id, 0, 0 FROM recipe_recipe;'
+)
+
+
+def create_scores(apps, schema_editor):
+    """Пустые оценки для существующих рецептов; значения
+    заполняет команда refresh_recipe_scores.
+    """
+    schema_editor.execute(CREATE_SCORES)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0012_similar_recipes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='favoritelist',
+            name='date_added',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='Дата добавления'),
+            preserve_default=False,
+        ),
+        migrations.CreateModel(
+            name='RecipeScore',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='score', serialize=False, to='recipe.Recipe', verbose_name='Рецепт')),
+                ('popular', models.FloatField(default=0, verbose_name='Популярность')),
+                ('trending', models.FloatField(default=0, verbose_name='Популярность за последние дни')),
+            ],
+            options={
+                'verbose_name': 'Оценка рецепта',
+                'verbose_name_plural': 'Оценки рецептов',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='recipescore',
+            index=models.Index(fields=['-popular', '-recipe'], name='recipe_score_popular_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipescore',
+            index=models.Index(fields=['-trending', '-recipe'], name='recipe_score_trending_idx'),
+        ),
+        migrations.RunPython(create_scores, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,8 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from users.models import CounterFieldsMixin
 from users.validators import hex_color_field_validator
 
 User = get_user_model()
@@ -24,6 +26,12 @@ class Ingredient(models.Model):
         ordering = ['name', ]
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            models.UniqueConstraint(
+                name='unique_ingredient_name_unit',
+                fields=['name', 'measurement_unit'],
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -60,7 +68,7 @@ class Tag(models.Model):
         return f'{self.name} (цвет: {self.color})'
 
 
-class Recipe(models.Model):
+class Recipe(CounterFieldsMixin, models.Model):
     """Модель рецепта.
     Главная модель приложения, описывающая рецепт.
     """
@@ -88,6 +96,18 @@ class Recipe(models.Model):
         verbose_name='Изображение',
         upload_to='recipes/',
     )
+    image_thumbnail = models.ImageField(
+        blank=True,
+        verbose_name='Миниатюра изображения',
+        upload_to='recipes/variants/',
+        editable=False,
+    )
+    image_medium = models.ImageField(
+        blank=True,
+        verbose_name='Уменьшенное изображение',
+        upload_to='recipes/variants/',
+        editable=False,
+    )
     ingredients = models.ManyToManyField(
         Ingredient,
         related_name='recipes',
@@ -118,11 +138,38 @@ class Recipe(models.Model):
         'В списке покупок',
         default=False
     )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='Количество добавлений в избранное',
+        default=0,
+        editable=False,
+    )
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name='Количество добавлений в список покупок',
+        default=0,
+        editable=False,
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый вектор',
+    )
+
+    COUNTER_FIELDS = ('favorites_count', 'in_carts_count')
 
     class Meta:
         ordering = ['-pub_date', ]
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(
+                name='recipe_pub_date_id_idx',
+                fields=['-pub_date', '-id'],
+            ),
+            models.Index(
+                name='recipe_author_pub_date_idx',
+                fields=['author', '-pub_date'],
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -160,6 +207,12 @@ class IngredientAmount(models.Model):
         ordering = ['-id', ]
         verbose_name = 'Количество ингредиента'
         verbose_name_plural = 'Количество ингредиентов'
+        indexes = [
+            models.Index(
+                name='amount_recipe_ingredient_idx',
+                fields=['recipe', 'ingredient', 'amount'],
+            ),
+        ]
         constraints = [
             models.UniqueConstraint(
                 name='unique_relationships_ingredient_recipe',
@@ -189,6 +242,10 @@ class FavoriteList(models.Model):
         related_name='favorite_recipe',
         verbose_name='Избранный рецепт',
     )
+    date_added = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата добавления',
+    )
 
     class Meta:
         verbose_name = 'Избранный рецепт пользователя'
@@ -230,6 +287,12 @@ class ShoppingList(models.Model):
         ordering = ['-date_added', ]
         verbose_name = 'Список покупок'
         verbose_name_plural = 'Списки покупок'
+        indexes = [
+            models.Index(
+                name='shoplist_user_date_idx',
+                fields=['user', '-date_added'],
+            ),
+        ]
         constraints = [
             models.UniqueConstraint(
                 name='unique_user_recipe_shoplist',
@@ -239,3 +302,153 @@ class ShoppingList(models.Model):
 
     def __str__(self):
         return (f'У {self.user} в списке покупок рецепт {self.recipe}')
+
+
+class TimelineEntry(models.Model):
+    """Запись ленты подписок пользователя.
+    Лента хранится только для пользователей с большим числом подписок
+    и пополняется при публикации рецепта (см. recipe.timeline).
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Пользователь',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Рецепт',
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты подписок'
+        verbose_name_plural = 'Записи лент подписок'
+        constraints = [
+            models.UniqueConstraint(
+                name='unique_user_timeline_recipe',
+                fields=['user', 'recipe'],
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} в ленте {self.user}'
+
+
+class RecipeImageTask(models.Model):
+    """Задание на подготовку уменьшенных копий изображения рецепта.
+    Очередь разбирается пулом потоков веб-процесса
+    и командой process_images (см. recipe.images).
+    """
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='image_task',
+        verbose_name='Рецепт',
+    )
+    created_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Поставлено в очередь',
+    )
+    started_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Взято в обработку',
+    )
+    attempts = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name='Количество попыток',
+    )
+    error = models.TextField(
+        blank=True,
+        verbose_name='Последняя ошибка',
+    )
+
+    class Meta:
+        ordering = ['created_at', ]
+        verbose_name = 'Обработка изображения'
+        verbose_name_plural = 'Обработка изображений'
+
+    def __str__(self):
+        return f'Изображение рецепта {self.recipe_id}'
+
+
+class SimilarRecipe(models.Model):
+    """Похожий рецепт с мерой сходства.
+    Таблица пересчитывается командой build_similar_recipes
+    (см. recipe.similar).
+    """
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_recipes',
+        verbose_name='Рецепт',
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_to',
+        verbose_name='Похожий рецепт',
+    )
+    score = models.FloatField(verbose_name='Сходство')
+
+    class Meta:
+        ordering = ['recipe', '-score']
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        indexes = [
+            models.Index(
+                name='similar_recipe_score_idx',
+                fields=['recipe', '-score'],
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                name='unique_similar_recipe',
+                fields=['recipe', 'similar'],
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.similar} похож на {self.recipe}: {self.score:.2f}'
+
+
+class RecipeScore(models.Model):
+    """Материализованные оценки популярности рецепта с экспоненциальным
+    затуханием. Оценки хранятся в логарифмической шкале относительно
+    RECIPE_SCORE_EPOCH, поэтому их не нужно пересчитывать со временем
+    (см. recipe.scores).
+    """
+    recipe = models.OneToOneField(
+        Recipe,
+        primary_key=True,
+        on_delete=models.CASCADE,
+        related_name='score',
+        verbose_name='Рецепт',
+    )
+    popular = models.FloatField(
+        default=0,
+        verbose_name='Популярность',
+    )
+    trending = models.FloatField(
+        default=0,
+        verbose_name='Популярность за последние дни',
+    )
+
+    class Meta:
+        verbose_name = 'Оценка рецепта'
+        verbose_name_plural = 'Оценки рецептов'
+        indexes = [
+            models.Index(
+                name='recipe_score_popular_idx',
+                fields=['-popular', '-recipe'],
+            ),
+            models.Index(
+                name='recipe_score_trending_idx',
+                fields=['-trending', '-recipe'],
+            ),
+        ]
+
+    def __str__(self):
+        return f'Оценка рецепта {self.recipe_id}'
@@ -0,0 +1,116 @@
+import math
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.functions import Abs, Exp, Greatest, Ln
+
+from .models import FavoriteList, Recipe, RecipeScore, ShoppingList
+
+SCORES = ('popular', 'trending')
+# Доля оценки, ниже которой остаток после отмены события считается нулём.
+MIN_REMAINDER = 1e-9
+
+
+def decay_rate(name):
+    """Скорость затухания оценки name, 1/с.
+    """
+    return math.log(2) / settings.RECIPE_SCORE_HALF_LIFE[name]
+
+
+def event_value(name, weight, moment):
+    """Вклад события в логарифмической шкале:
+    log(weight) + rate * (moment - RECIPE_SCORE_EPOCH).
+    Затухание общее для всех рецептов, поэтому порядок по сохранённым
+    значениям совпадает с порядком по текущим оценкам, а значения растут
+    со временем линейно и не переполняются.
+    """
+    elapsed = (moment - settings.RECIPE_SCORE_EPOCH).total_seconds()
+    return math.log(weight) + decay_rate(name) * elapsed
+
+
+def log_add(score, value):
+    return max(score, value) + math.log1p(math.exp(-abs(score - value)))
+
+
+def _add(name, value):
+    value = Value(value, output_field=FloatField())
+    return Greatest(F(name), value) + Ln(
+        1 + Exp(-Abs(F(name) - value))
+    )
+
+
+def _subtract(name, value):
+    """log(e^a - e^value); если остаток не больше MIN_REMAINDER
+    (то есть a <= value - log(1 - MIN_REMAINDER)), оценка обнуляется.
+    """
+    threshold = value - math.log1p(-MIN_REMAINDER)
+    value = Value(value, output_field=FloatField())
+    zero = Value(0.0, output_field=FloatField())
+    return Case(
+        When(**{f'{name}__lte': threshold}, then=zero),
+        default=Greatest(F(name) + Ln(Greatest(
+            1 - Exp(value - F(name)),
+            Value(MIN_REMAINDER, output_field=FloatField())
+        )), zero),
+        output_field=FloatField(),
+    )
+
+
+EVENT_WEIGHTS = (
+    (FavoriteList, 'RECIPE_SCORE_FAVORITE_WEIGHT'),
+    (ShoppingList, 'RECIPE_SCORE_CART_WEIGHT'),
+)
+
+
+def record_event(model, recipe_id, moment, removed=False):
+    """Инкрементальное обновление оценок рецепта одним событием:
+    добавлением в избранное или список покупок либо его отменой.
+    Значение 0 соответствует рецепту без событий.
+    """
+    weight = getattr(settings, dict(EVENT_WEIGHTS)[model])
+    operation = _subtract if removed else _add
+    RecipeScore.objects.filter(recipe_id=recipe_id).update(**{
+        name: operation(name, event_value(name, weight, moment))
+        for name in SCORES
+    })
+
+
+def refresh_scores(batch_size=None):
+    """Полный пересчёт оценок по текущему избранному и спискам покупок
+    пачками рецептов, с созданием недостающих строк. Исправляет
+    накопленную погрешность инкрементальных обновлений. Возвращает
+    число обработанных рецептов.
+    """
+    batch_size = batch_size or settings.RECIPE_SCORE_BATCH_SIZE
+    scores = defaultdict(lambda: [0.0] * len(SCORES))
+    for model, setting in EVENT_WEIGHTS:
+        weight = getattr(settings, setting)
+        for recipe_id, moment in model.objects.order_by().values_list(
+            'recipe_id', 'date_added'
+        ).iterator():
+            values = scores[recipe_id]
+            for position, name in enumerate(SCORES):
+                values[position] = log_add(
+                    values[position], event_value(name, weight, moment)
+                )
+    recipe_ids = iter(Recipe.objects.order_by('id').values_list(
+        'id', flat=True
+    ))
+    processed = 0
+    while True:
+        batch = list(islice(recipe_ids, batch_size))
+        if not batch:
+            return processed
+        entries = [
+            RecipeScore(recipe_id=recipe_id, **dict(zip(
+                SCORES, scores.get(recipe_id, (0.0,) * len(SCORES))
+            )))
+            for recipe_id in batch
+        ]
+        with transaction.atomic():
+            RecipeScore.objects.filter(recipe_id__in=batch).delete()
+            RecipeScore.objects.bulk_create(entries)
+        processed += len(batch)
@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchVector
+from django.db import connection, transaction
+from django.db.models import OuterRef, Subquery
+
+from .models import IngredientAmount, Recipe
+
+SEARCH_FIELDS = {'name', 'text'}
+
+
+def uses_search_vector():
+    """Поле search_vector поддерживается только в PostgreSQL,
+    для остальных баз используется индекс в памяти процесса.
+    """
+    return connection.vendor == 'postgresql'
+
+
+def search_fields_changed(update_fields):
+    """Затрагивает ли сохранение рецепта поля, по которым идёт поиск.
+    """
+    return update_fields is None or bool(SEARCH_FIELDS & set(update_fields))
+
+
+def search_vector():
+    """Выражение для search_vector: название рецепта важнее описания,
+    описание важнее названий ингредиентов.
+    """
+    config = settings.RECIPE_SEARCH_CONFIG
+    ingredient_names = Subquery(
+        IngredientAmount.objects.filter(
+            recipe=OuterRef('pk')
+        ).order_by().values('recipe').annotate(
+            names=StringAgg('ingredient__name', ' ')
+        ).values('names')
+    )
+    return (
+        SearchVector('name', weight='A', config=config)
+        + SearchVector('text', weight='B', config=config)
+        + SearchVector(ingredient_names, weight='C', config=config)
+    )
+
+
+def update_search_vectors(queryset=None):
+    if not uses_search_vector():
+        return 0
+    if queryset is None:
+        queryset = Recipe.objects.all()
+    return queryset.update(search_vector=search_vector())
+
+
+def schedule_update(queryset):
+    """Пересчёт search_vector после фиксации транзакции, когда
+    ингредиенты рецепта, добавленные через bulk_create, уже сохранены.
+    """
+    if uses_search_vector():
+        transaction.on_commit(lambda: update_search_vectors(queryset))
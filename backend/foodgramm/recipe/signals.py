@@ -0,0 +1,82 @@
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from users.models import User
+
+from . import scores, search, timeline
+from .models import (FavoriteList, Ingredient, IngredientAmount, Recipe,
+                     RecipeScore, ShoppingList)
+
+
+def change_counter(model, pk, field, delta):
+    """Атомарное изменение счётчика на стороне базы.
+    """
+    if pk is None:
+        return
+    queryset = model.objects.filter(pk=pk)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+@receiver(post_save, sender=FavoriteList)
+def favorite_added(sender, instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, instance.recipe_id, 'favorites_count', 1)
+        scores.record_event(sender, instance.recipe_id, instance.date_added)
+
+
+@receiver(post_delete, sender=FavoriteList)
+def favorite_removed(sender, instance, **kwargs):
+    change_counter(Recipe, instance.recipe_id, 'favorites_count', -1)
+    scores.record_event(
+        sender, instance.recipe_id, instance.date_added, removed=True
+    )
+
+
+@receiver(post_save, sender=ShoppingList)
+def cart_added(sender, instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, instance.recipe_id, 'in_carts_count', 1)
+        scores.record_event(sender, instance.recipe_id, instance.date_added)
+
+
+@receiver(post_delete, sender=ShoppingList)
+def cart_removed(sender, instance, **kwargs):
+    change_counter(Recipe, instance.recipe_id, 'in_carts_count', -1)
+    scores.record_event(
+        sender, instance.recipe_id, instance.date_added, removed=True
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_added(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.author_id, 'recipes_count', 1)
+        RecipeScore.objects.create(recipe=instance)
+        timeline.fan_out(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_removed(sender, instance, **kwargs):
+    change_counter(User, instance.author_id, 'recipes_count', -1)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, update_fields, **kwargs):
+    if search.search_fields_changed(update_fields):
+        search.schedule_update(Recipe.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=IngredientAmount)
+@receiver(post_delete, sender=IngredientAmount)
+def recipe_ingredients_changed(sender, instance, **kwargs):
+    search.schedule_update(Recipe.objects.filter(pk=instance.recipe_id))
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_saved(sender, instance, created, **kwargs):
+    if not created:
+        search.schedule_update(Recipe.objects.filter(
+            ingredient_in_recipe__ingredient=instance
+        ))
@@ -0,0 +1,137 @@
+import heapq
+import math
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import IngredientAmount, Recipe, SimilarRecipe
+
+NO_TAGS = frozenset()
+
+
+class RecipeVectors:
+    """Разреженные векторы рецептов: ингредиенты с весом idf
+    и тэги с весом SIMILAR_RECIPES_TAG_WEIGHT.
+    Скалярные произведения считаются по обратному индексу ингредиентов,
+    то есть перебираются только рецепты с общими ингредиентами.
+    Ингредиенты, которые встречаются в доле рецептов больше
+    SIMILAR_RECIPES_MAX_DF (и не меньше чем в SIMILAR_RECIPES_MIN_COMMON_DF
+    рецептах, чтобы в небольшом каталоге общими не оказались все),
+    кандидатов не добавляют, но учитываются в сходстве найденных
+    кандидатов. Если все ингредиенты рецепта общие, кандидаты берутся
+    по самому редкому из них.
+    """
+    def __init__(self):
+        self.ingredients = defaultdict(list)
+        self.postings = defaultdict(list)
+        for recipe_id, ingredient_id in IngredientAmount.objects.order_by(
+            'recipe_id'
+        ).values_list('recipe_id', 'ingredient_id').iterator():
+            self.ingredients[recipe_id].append(ingredient_id)
+            self.postings[ingredient_id].append(recipe_id)
+        tags = defaultdict(set)
+        for recipe_id, tag_id in Recipe.tags.through.objects.values_list(
+            'recipe_id', 'tag_id'
+        ).iterator():
+            tags[recipe_id].add(tag_id)
+        self.tags = dict(tags)
+        total = Recipe.objects.count()
+        # Квадраты весов: вклад общего ингредиента в скалярное произведение.
+        self.squared_weights = {
+            ingredient_id: (
+                math.log((1 + total) / (1 + len(recipe_ids))) + 1
+            ) ** 2
+            for ingredient_id, recipe_ids in self.postings.items()
+        }
+        cutoff = max(
+            settings.SIMILAR_RECIPES_MAX_DF * total,
+            settings.SIMILAR_RECIPES_MIN_COMMON_DF,
+        )
+        self.common = {
+            ingredient_id
+            for ingredient_id, recipe_ids in self.postings.items()
+            if len(recipe_ids) > cutoff
+        }
+        tag_weight = settings.SIMILAR_RECIPES_TAG_WEIGHT ** 2
+        self.tag_weight = tag_weight
+        self.norms = {
+            recipe_id: math.sqrt(
+                sum(map(self.squared_weights.__getitem__, ingredient_ids))
+                + tag_weight * len(self.tags.get(recipe_id, NO_TAGS))
+            )
+            for recipe_id, ingredient_ids in self.ingredients.items()
+        }
+
+    def neighbours(self, recipe_id, count):
+        """Не больше count пар (сходство, рецепт) с наибольшим
+        косинусным сходством.
+        """
+        features = self.ingredients.get(recipe_id, ())
+        dots = defaultdict(float)
+        for ingredient_id in features:
+            if ingredient_id in self.common:
+                continue
+            weight = self.squared_weights[ingredient_id]
+            for candidate in self.postings[ingredient_id]:
+                dots[candidate] += weight
+        common = [
+            ingredient_id for ingredient_id in features
+            if ingredient_id in self.common
+        ]
+        if not dots and common:
+            rarest = min(
+                common, key=lambda ingredient_id: len(
+                    self.postings[ingredient_id]
+                )
+            )
+            dots = dict.fromkeys(self.postings[rarest], 0.0)
+        dots.pop(recipe_id, None)
+        tags = self.tags.get(recipe_id)
+        norm = self.norms[recipe_id]
+        scores = []
+        for candidate, dot in dots.items():
+            if common:
+                dot += sum(
+                    self.squared_weights[ingredient_id]
+                    for ingredient_id in common
+                    if ingredient_id in self.ingredients[candidate]
+                )
+            if tags:
+                dot += self.tag_weight * len(
+                    tags & self.tags.get(candidate, NO_TAGS)
+                )
+            scores.append((dot / (norm * self.norms[candidate]), candidate))
+        return heapq.nlargest(count, scores)
+
+
+def build_similar(recipe_ids=None, batch_size=None):
+    """Пересчёт таблицы похожих рецептов пачками: для каждой пачки
+    старые записи заменяются в одной транзакции. Возвращает
+    число обработанных рецептов.
+    """
+    vectors = RecipeVectors()
+    count = settings.SIMILAR_RECIPES_COUNT
+    batch_size = batch_size or settings.SIMILAR_RECIPES_BATCH_SIZE
+    if recipe_ids is None:
+        recipe_ids = Recipe.objects.order_by('id').values_list(
+            'id', flat=True
+        )
+    recipe_ids = iter(recipe_ids)
+    processed = 0
+    while True:
+        batch = list(islice(recipe_ids, batch_size))
+        if not batch:
+            return processed
+        entries = [
+            SimilarRecipe(recipe_id=recipe_id, similar_id=similar_id,
+                          score=score)
+            for recipe_id in batch
+            if recipe_id in vectors.norms
+            for score, similar_id in vectors.neighbours(recipe_id, count)
+        ]
+        with transaction.atomic():
+            SimilarRecipe.objects.filter(recipe_id__in=batch).delete()
+            SimilarRecipe.objects.bulk_create(entries)
+        processed += len(batch)
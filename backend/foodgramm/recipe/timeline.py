@@ -0,0 +1,117 @@
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import Count, Q
+from users.models import Follow, User
+
+from .models import Recipe, TimelineEntry
+
+
+def uses_timeline(following_count):
+    return following_count >= settings.FEED_TIMELINE_MIN_FOLLOWS
+
+
+def feed_filter(user):
+    """Условие отбора рецептов ленты подписок пользователя.
+    При большом числе подписок лента читается из TimelineEntry,
+    иначе рецепты авторов выбираются напрямую по индексу
+    (author, -pub_date).
+    """
+    if uses_timeline(user.following_count):
+        return Q(timeline_entries__user=user)
+    return Q(author__following__user=user)
+
+
+def _insert(entries):
+    entries = iter(entries)
+    while True:
+        batch = list(islice(entries, settings.FEED_TIMELINE_BATCH_SIZE))
+        if not batch:
+            return
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def _latest(queryset):
+    return queryset.order_by('-pub_date', '-id').values_list(
+        'id', flat=True
+    )[:settings.FEED_TIMELINE_LENGTH]
+
+
+def fan_out(recipe):
+    """Добавление нового рецепта в ленты подписчиков автора,
+    для которых хранится лента. Ленты, ставшие длиннее
+    FEED_TIMELINE_LENGTH, обрезает периодический запуск
+    build_timelines --trim: лента читается постранично от новых
+    записей, поэтому лишние старые записи ей не мешают.
+    """
+    followers = Follow.objects.filter(
+        author_id=recipe.author_id,
+        user__following_count__gte=settings.FEED_TIMELINE_MIN_FOLLOWS,
+    ).values_list('user_id', flat=True)
+    _insert(
+        TimelineEntry(user_id=user_id, recipe_id=recipe.id)
+        for user_id in followers.iterator()
+    )
+
+
+def build_timeline(user_id):
+    """Пересборка ленты: последние FEED_TIMELINE_LENGTH рецептов
+    авторов, на которых подписан пользователь.
+    """
+    TimelineEntry.objects.filter(user_id=user_id).delete()
+    recipes = _latest(
+        Recipe.objects.filter(author__following__user_id=user_id)
+    )
+    _insert(
+        TimelineEntry(user_id=user_id, recipe_id=recipe_id)
+        for recipe_id in recipes
+    )
+
+
+def overflowing_timelines():
+    """Пользователи, лента которых длиннее FEED_TIMELINE_LENGTH.
+    """
+    return TimelineEntry.objects.order_by().values('user_id').annotate(
+        total=Count('pk')
+    ).filter(total__gt=settings.FEED_TIMELINE_LENGTH).values_list(
+        'user_id', flat=True
+    )
+
+
+def trim_timeline(user_id):
+    """Удаление записей сверх FEED_TIMELINE_LENGTH последних.
+    """
+    return TimelineEntry.objects.filter(user_id=user_id).exclude(
+        recipe_id__in=_latest(Recipe.objects.filter(
+            timeline_entries__user_id=user_id
+        ))
+    ).delete()[0]
+
+
+def _following_count(user_id):
+    return User.objects.filter(pk=user_id).values_list(
+        'following_count', flat=True
+    ).first() or 0
+
+
+def follow_added(user_id, author_id):
+    count = _following_count(user_id)
+    if count == settings.FEED_TIMELINE_MIN_FOLLOWS:
+        build_timeline(user_id)
+    elif uses_timeline(count):
+        _insert(
+            TimelineEntry(user_id=user_id, recipe_id=recipe_id)
+            for recipe_id in _latest(Recipe.objects.filter(
+                author_id=author_id
+            ))
+        )
+        trim_timeline(user_id)
+
+
+def follow_removed(user_id, author_id):
+    count = _following_count(user_id)
+    entries = TimelineEntry.objects.filter(user_id=user_id)
+    if uses_timeline(count):
+        entries.filter(recipe__author_id=author_id).delete()
+    elif count == settings.FEED_TIMELINE_MIN_FOLLOWS - 1:
+        entries.delete()
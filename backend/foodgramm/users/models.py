@@ -6,7 +6,29 @@ from django.db.models import UniqueConstraint
 from .validators import username_validator_not_past_me, validate_username
 
 
-class User(AbstractUser):
+class CounterFieldsMixin:
+    """Денормализованные счётчики меняются только F-выражениями
+    в сигналах. Полное сохранение существующей записи их не записывает,
+    чтобы устаревший экземпляр не затёр значения, изменённые другими
+    запросами.
+    """
+    COUNTER_FIELDS = ()
+
+    def save(self, *args, **kwargs):
+        if (not self._state.adding and not args
+                and kwargs.get('update_fields') is None
+                and not kwargs.get('force_insert')):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.COUNTER_FIELDS
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
+
+class User(CounterFieldsMixin, AbstractUser):
     """Кастомная модель пользователя
     """
 
@@ -53,7 +75,23 @@ class User(AbstractUser):
         to='self',
         symmetrical=False,
     )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Количество рецептов',
+        default=0,
+        editable=False,
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Количество подписчиков',
+        default=0,
+        editable=False,
+    )
+    following_count = models.PositiveIntegerField(
+        verbose_name='Количество подписок',
+        default=0,
+        editable=False,
+    )
 
+    COUNTER_FIELDS = ('recipes_count', 'followers_count', 'following_count')
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = [
         'username',
@@ -91,6 +129,12 @@ class Follow(models.Model):
         ordering = ['-author_id', ]
         verbose_name = 'Подписка на автора'
         verbose_name_plural = 'Подписки на авторов'
+        indexes = [
+            models.Index(
+                name='follow_author_user_idx',
+                fields=['author', 'user'],
+            ),
+        ]
         constraints = [
             UniqueConstraint(
                 name='unique_user_following',